@@ -15,20 +15,28 @@ Including another URLconf
 """
 from django.conf.urls import url
 from django.contrib import admin
-from lets_play_app.views import SignUpView, HomeView, ShowProfileView, CreateReservationView,\
+from lets_play_app.views import SignUpView, HomeView, ShowProfileView, ProfileStatsView, CreateReservationView,\
     SportCenterDetailView, SportCenterListView, JoinRoomView, ReservationDetailView, DeleteRoom,\
-    UserReservationsView, UserHistoryView, EditProfileView, UserFutureGamesView, MessagesView
+    UserReservationsView, UserHistoryView, EditProfileView, UserFutureGamesView, MessagesView, LeaderboardView, \
+    AvatarThumbnailView, CacheStatsView, CalendarFeedView, BulkScoresView, UtilizationView, UtilizationCsvView
 from django.contrib.auth import views as auth_views
+from lets_play_app.api import OpenRoomsApiView, HistoryApiView, SportCentresApiView, StandingsApiView,\
+    JoinRoomApiView
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
+    url(r'^admin/cache_stats/$', admin.site.admin_view(CacheStatsView.as_view()), name='cache_stats'),
+    url(r'^admin/scores/$', admin.site.admin_view(BulkScoresView.as_view()), name='bulk_scores'),
+    url(r'^admin/utilization/$', admin.site.admin_view(UtilizationView.as_view()), name='utilization'),
+    url(r'^admin/utilization\.csv$', admin.site.admin_view(UtilizationCsvView.as_view()), name='utilization_csv'),
     url(r'^admin/', admin.site.urls),
     url(r'^$', HomeView.as_view()),
     url(r'^signup/$', SignUpView.as_view(), name='signup'),
     url(r'^login/$', auth_views.login, name='login'),
     url(r'^logout/$', auth_views.logout, {'next_page': '/'}, name='logout'),
     url(r'^profile/(?P<user_id>[0-9]+)$', ShowProfileView.as_view(), name='profile'),
+    url(r'^profile/(?P<user_id>[0-9]+)/stats$', ProfileStatsView.as_view(), name='profile_stats'),
     url(r'^create_reservation/$', CreateReservationView.as_view(), name='create_reservation'),
     url(r'^sport_center/(?P<slug>[\w-]+)$', SportCenterDetailView.as_view(), name='sp_detail'),
     url(r'^sport_centres/$', SportCenterListView.as_view(), name='create_room'),
@@ -40,7 +48,16 @@ urlpatterns = [
     url(r'^user_games/$', UserFutureGamesView.as_view(), name='user_games'),
     url(r'^edit_profile/$', EditProfileView.as_view(), name='edit_profile'),
     url(r'^messages/$', MessagesView.as_view(), name='messages'),
-    # url(r'^calendar/$', MessagesView.as_view(), name='messages'),
+    url(r'^leaderboard/$', LeaderboardView.as_view(), name='leaderboard'),
+    url(r'^leaderboard/(?P<skill>[1-4])$', LeaderboardView.as_view(), name='leaderboard_tier'),
+    url(r'^avatars/(?P<size>[0-9]+)/(?P<name>.+)$', AvatarThumbnailView.as_view(), name='avatar_thumbnail'),
+    url(r'^calendar/(?P<token>[0-9]+:[\w-]+)\.ics$', CalendarFeedView.as_view(), name='calendar_feed'),
+
+    url(r'^api/rooms/$', OpenRoomsApiView.as_view(), name='api_rooms'),
+    url(r'^api/rooms/(?P<room_id>[\d]+)/join/$', JoinRoomApiView.as_view(), name='api_join_room'),
+    url(r'^api/history/$', HistoryApiView.as_view(), name='api_history'),
+    url(r'^api/sport_centres/$', SportCentresApiView.as_view(), name='api_sport_centres'),
+    url(r'^api/standings/(?P<skill>[1-4])/$', StandingsApiView.as_view(), name='api_standings'),
 
     #reset password
     url(r'^password_reset/$', auth_views.password_reset, name='password_reset'),
@@ -10,6 +10,16 @@ https://docs.djangoproject.com/en/1.11/howto/deployment/wsgi/
 import os
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lets_play_app.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lets_play.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.ASSET_MODE == 'production':
+    from lets_play_app.wsgi_static import StaticFilesMiddleware, HASHED_NAME, CONTENT_ADDRESSED_NAME
+
+    application = StaticFilesMiddleware(application, [
+        (settings.STATIC_URL, settings.STATIC_ROOT, HASHED_NAME),
+        (settings.MEDIA_URL, settings.MEDIA_ROOT, CONTENT_ADDRESSED_NAME),
+    ])
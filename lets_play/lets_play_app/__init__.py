@@ -0,0 +1 @@
+default_app_config = 'lets_play_app.apps.LetsPlayAppConfig'
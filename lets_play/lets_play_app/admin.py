@@ -1,12 +1,147 @@
 from django.contrib import admin
+from django.db import connection
 
-# Register your models here.
-from .models import *
+from . import bulk_scores, ical, inbox, page_cache
+from .models import MyUser, SportCenter, Rooms, SquashCourt, Reservation, Score, UserStats, RatingHistory, Messages,\
+    Notification
+from .pagination import EstimatedCountPaginator
 
-admin.site.register(MyUser)
-admin.site.register(SportCenter)
-admin.site.register(Rooms)
-admin.site.register(Reservation)
-admin.site.register(UserStats)
-admin.site.register(Messages)
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelists that stay quick on tables of millions of rows.
+
+    Foreign keys are shown with ``list_select_related`` and edited with ``raw_id_fields`` so neither the list nor
+    the form loads a related table, and only the paginator counts rows. Actions change the selected rows with one
+    UPDATE or DELETE instead of saving them one by one.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def message_changed(self, request, count):
+        self.message_user(request, 'Zmieniono rekordów: %s.' % count)
+
+
+@admin.register(MyUser)
+class MyUserAdmin(LargeTableAdmin):
+    list_display = ('username', 'email', 'skill', 'is_active', 'is_staff', 'last_login')
+    list_filter = ('skill',)
+    search_fields = ('^username', '^email')
+    actions = ['deactivate']
+
+    def deactivate(self, request, queryset):
+        self.message_changed(request, queryset.update(is_active=False))
+    deactivate.short_description = 'Zablokuj wybranych graczy'
+
+
+@admin.register(SportCenter)
+class SportCenterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'address', 'phone_number', 'slug')
+    search_fields = ('name',)
+
+
+@admin.register(Rooms)
+class RoomsAdmin(LargeTableAdmin):
+    list_display = ('__str__', 'room_number', 'availability')
+    list_select_related = ('sport_center',)
+    list_filter = ('sport_center',)
+    actions = ['open_courts', 'close_courts']
+
+    def set_availability(self, request, queryset, availability):
+        slugs = set(queryset.values_list('sport_center__slug', flat=True).distinct())
+        self.message_changed(request, queryset.update(availability=availability))
+        # update() sends no post_save, so the centres' pages are invalidated here.
+        page_cache.invalidate(*[page_cache.sport_center_scope(slug) for slug in slugs])
+
+    def open_courts(self, request, queryset):
+        self.set_availability(request, queryset, True)
+    open_courts.short_description = 'Udostępnij wybrane korty'
+
+    def close_courts(self, request, queryset):
+        self.set_availability(request, queryset, False)
+    close_courts.short_description = 'Wyłącz wybrane korty'
+
+
+@admin.register(SquashCourt)
+class SquashCourtAdmin(LargeTableAdmin):
+    list_display = ('sport_center', 'room_number')
+    list_select_related = ('sport_center',)
+    list_filter = ('sport_center',)
+
+
+@admin.register(Reservation)
+class ReservationAdmin(LargeTableAdmin):
+    list_display = ('id', 'date', 'time_start', 'time_end', 'location', 'user_main', 'user_partner')
+    list_select_related = ('location', 'user_main', 'user_partner')
+    list_filter = ('location',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('user_main', 'user_partner')
+    actions = ['delete_open_rooms']
+
+    def delete_open_rooms(self, request, queryset):
+        """Delete the selected rooms nobody joined and nobody scored, with one DELETE whatever the selection."""
+        open_rooms = queryset.filter(user_partner__isnull=True, score__isnull=True)
+        affected = list(open_rooms.values_list('user_main_id', 'location__slug').distinct())
+        selected, params = open_rooms.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            # Plain SQL: a queryset delete would load every row to send post_delete.
+            cursor.execute('DELETE FROM %s WHERE id IN (%s)' % (
+                connection.ops.quote_name(Reservation._meta.db_table), selected), params)
+            deleted = cursor.rowcount
+        ical.invalidate(*{user_id for user_id, slug in affected})
+        page_cache.invalidate(*{page_cache.sport_center_scope(slug) for user_id, slug in affected})
+        self.message_changed(request, deleted)
+    delete_open_rooms.short_description = 'Usuń wybrane rezerwacje bez przeciwnika'
+
+
+@admin.register(Score)
+class ScoreAdmin(LargeTableAdmin):
+    list_display = ('room', 'room_date', 'user_main_score', 'user_partner_score', 'is_confirmed_by_user_main',
+                    'is_confirmed_by_user_partner')
+    list_select_related = ('room',)
+    raw_id_fields = ('room',)
+    actions = ['confirm']
+
+    def room_date(self, score):
+        return score.room.date
+    room_date.short_description = 'Data'
+    room_date.admin_order_field = 'room__date'
+
+    def confirm(self, request, queryset):
+        self.message_changed(request, len(bulk_scores.confirm(queryset.values_list('pk', flat=True))))
+    confirm.short_description = 'Potwierdź wybrane wyniki za obu graczy'
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(LargeTableAdmin):
+    list_display = ('user', 'games_played', 'games_won', 'games_lost', 'ranking')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(RatingHistory)
+class RatingHistoryAdmin(LargeTableAdmin):
+    list_display = ('user', 'date', 'rating', 'rating_change')
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'score')
+
+
+@admin.register(Messages)
+class MessagesAdmin(LargeTableAdmin):
+    list_display = ('content', 'user', 'date', 'is_read')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    actions = ['mark_read']
+
+    def mark_read(self, request, queryset):
+        user_ids = set(queryset.filter(is_read=False).values_list('user_id', flat=True).distinct())
+        self.message_changed(request, queryset.filter(is_read=False).update(is_read=True))
+        inbox.invalidate(*user_ids)
+    mark_read.short_description = 'Oznacz wybrane wiadomości jako przeczytane'
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('content', 'user', 'event', 'created', 'processed_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
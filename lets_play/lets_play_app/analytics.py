@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Head-to-head records, results per sport centre and most frequent partners of a player.
+
+Each list is one grouped aggregate query over the player's reservations joined to their scores, whatever the length
+of the history. The player may sit on either side of a reservation, so the opponent and the winner are picked with
+CASE expressions. Results are cached per player until one of their games changes.
+"""
+
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, F, Case, When, Count, Sum, IntegerField, CharField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Reservation, Score
+from .signals import score_confirmed, reservation_joined
+
+CACHE_TIMEOUT = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 60 * 60)
+PARTNERS = 5
+
+
+class Record(namedtuple('Record', 'id name games won sets_won sets_lost')):
+    """Confirmed results against one opponent or at one sport centre."""
+
+    @property
+    def lost(self):
+        return self.games - self.won
+
+    @property
+    def win_rate(self):
+        return 100.0 * self.won / self.games if self.games else 0.0
+
+
+Partner = namedtuple('Partner', 'id name games')
+PlayerAnalytics = namedtuple('PlayerAnalytics', 'head_to_head centres partners')
+
+
+def _version_key(user_id):
+    return 'analytics:%s:version' % user_id
+
+
+def _key(user_id, version):
+    return 'analytics:%s:%s' % (user_id, version)
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Time based so an evicted version key never resurrects old results.
+        cache.add(_version_key(user_id), int(time.time() * 1000), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate(*user_ids):
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), int(time.time() * 1000), None)
+
+
+def _opponent(user_id, field):
+    return Case(When(user_main_id=user_id, then=F('user_partner__%s' % field)), default=F('user_main__%s' % field),
+                output_field=IntegerField() if field == 'id' else CharField())
+
+
+def _side(user_id, main, partner):
+    # The player's own value for a field that exists once for each side of the reservation.
+    return Case(When(user_main_id=user_id, then=F(main)), default=F(partner), output_field=IntegerField())
+
+
+def _results(user_id, group_by):
+    """Confirmed games of ``user_id`` grouped by the ``other_id`` and ``other_name`` expressions, most played first."""
+    won = Case(When(Q(user_main_id=user_id, score__user_main_score__gt=F('score__user_partner_score')) |
+                    Q(user_partner_id=user_id, score__user_main_score__lte=F('score__user_partner_score')),
+                    then=1),
+               default=0, output_field=IntegerField())
+    rows = Reservation.objects.filter(Q(user_main_id=user_id) | Q(user_partner_id=user_id),
+                                      score__is_confirmed_by_user_main=True, score__is_confirmed_by_user_partner=True)\
+        .values(**group_by)\
+        .annotate(games=Count('id'), won=Sum(won),
+                  sets_won=Sum(_side(user_id, 'score__user_main_score', 'score__user_partner_score')),
+                  sets_lost=Sum(_side(user_id, 'score__user_partner_score', 'score__user_main_score')))\
+        .order_by('-games', 'other_name')
+    return [Record(row['other_id'], row['other_name'], row['games'], row['won'], row['sets_won'], row['sets_lost'])
+            for row in rows]
+
+
+def head_to_head(user_id):
+    return _results(user_id, {'other_id': _opponent(user_id, 'id'), 'other_name': _opponent(user_id, 'username')})
+
+
+def centres(user_id):
+    return _results(user_id, {'other_id': F('location_id'), 'other_name': F('location__name')})
+
+
+def partners(user_id, limit=PARTNERS):
+    """Players ``user_id`` booked the most games with, scored or not, upcoming included."""
+    rows = Reservation.objects.filter(Q(user_main_id=user_id) | Q(user_partner_id=user_id),
+                                      user_partner__isnull=False)\
+        .values(other_id=_opponent(user_id, 'id'), other_name=_opponent(user_id, 'username'))\
+        .annotate(games=Count('id')).order_by('-games', 'other_name')[:limit]
+    return [Partner(row['other_id'], row['other_name'], row['games']) for row in rows]
+
+
+def player_analytics(user_id):
+    """All three lists for the profile tab: served from cache, or three queries."""
+    key = _key(user_id, _version(user_id))
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = PlayerAnalytics(head_to_head(user_id), centres(user_id), partners(user_id))
+        cache.set(key, analytics, CACHE_TIMEOUT)
+    return analytics
+
+
+@receiver(score_confirmed)
+def invalidate_confirmed_players(sender, score, **kwargs):
+    invalidate(score.room.user_main_id, score.room.user_partner_id)
+
+
+@receiver(post_delete, sender=Score)
+def invalidate_deleted_score(sender, instance, **kwargs):
+    if instance.is_confirmed:
+        invalidate(*Reservation.objects.filter(pk=instance.room_id)
+                   .values_list('user_main_id', 'user_partner_id').first() or ())
+
+
+@receiver(reservation_joined)
+def invalidate_joined_partners(sender, reservation, **kwargs):
+    invalidate(reservation.user_main_id, reservation.user_partner_id)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_reservation_players(sender, instance, **kwargs):
+    # Partners count every booked game, and a game moved to another centre changes the centre records.
+    invalidate(instance.user_main_id, instance.user_partner_id)
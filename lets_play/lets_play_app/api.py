@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Read-only JSON endpoints built on ``.values()`` projections, keyset cursors and ETags."""
+
+import datetime
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import quote_etag
+from django.views import View
+
+from . import ical, leaderboard, page_cache
+from .forms import RoomFilterForm
+from .models import Reservation, SportCenter, UserStats
+from .pagination import KeysetPaginator, InvalidCursor
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+class ApiListView(View):
+    """Base class of the list endpoints.
+
+    ``fields`` maps the public field names to ORM lookups; a name may not clash with a model field it does not
+    select. ``?fields=a,b`` limits the projection, ``?after=`` and ``?before=`` page through it and ``?limit=``
+    sets the page size.
+    """
+    fields = {}
+    default_fields = None
+    ordering = ()
+    login_required = True
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_version(self):
+        """Cheap fingerprint of the data, when one exists the ETag is checked before any query runs.
+
+        It must include the user for per-user endpoints.
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        if self.login_required and not request.user.is_authenticated:
+            return JsonResponse({'error': 'Wymagane logowanie.'}, status=401)
+        try:
+            version = self.get_version()
+            if version is not None:
+                etag = quote_etag(hashlib.md5(('%s:%s' % (version, request.get_full_path())).encode()).hexdigest())
+                if self.matches(etag):
+                    return self.not_modified(etag)
+            body = json.dumps(self.page(), cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=error.status)
+        if version is None:
+            etag = quote_etag(hashlib.md5(body).hexdigest())
+            if self.matches(etag):
+                return self.not_modified(etag)
+        response = HttpResponse(body, content_type='application/json; charset=utf-8')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def matches(self, etag):
+        return etag in [tag.strip() for tag in self.request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+
+    def not_modified(self, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    def selected_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.default_fields or sorted(self.fields))
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = sorted(set(names) - set(self.fields))
+        if unknown:
+            raise ApiError('Nieznane pola: %s. Dostępne: %s.' % (', '.join(unknown), ', '.join(sorted(self.fields))))
+        return names
+
+    def limit(self):
+        try:
+            return min(max(int(self.request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise ApiError('Parametr limit musi być liczbą.')
+
+    def page(self):
+        names = self.selected_fields()
+        keys = [name.lstrip('-') for name in self.ordering]
+        projection = {name: F(self.fields[name]) for name in names if self.fields[name] != name}
+        # Ordering keys are always selected, the cursor is built from them.
+        rows = self.get_queryset().values(*[name for name in set(names) | set(keys) if name not in projection],
+                                          **projection)
+        paginator = KeysetPaginator(rows, self.ordering, per_page=self.limit())
+        try:
+            page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except InvalidCursor:
+            raise ApiError('Nieprawidłowy kursor.')
+        return {'results': [{name: row[name] for name in names} for row in page.object_list],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor}
+
+
+class OpenRoomsApiView(ApiListView):
+    fields = {'id': 'id', 'date': 'date', 'time_start': 'time_start', 'time_end': 'time_end',
+              'comment': 'comment', 'location_id': 'location_id', 'location_name': 'location__name',
+              'host_id': 'user_main_id', 'host': 'user_main__username', 'host_skill': 'user_main__skill'}
+    default_fields = ('id', 'date', 'time_start', 'time_end', 'location_name', 'host')
+    ordering = ('date', 'id')
+
+    def get_queryset(self):
+        form = RoomFilterForm(self.request.GET)
+        if not form.is_valid():
+            raise ApiError(' '.join(error for errors in form.errors.values() for error in errors))
+        user = self.request.user
+        rooms = Reservation.objects.open().exclude(user_main=user)\
+            .filter(date__gte=form.cleaned_data['date_start'] or datetime.date.today())
+        skill = form.cleaned_data['skill'] or user.skill
+        if skill:
+            rooms = rooms.filter(user_main__skill=skill)
+        if form.cleaned_data['date_end']:
+            rooms = rooms.filter(date__lte=form.cleaned_data['date_end'])
+        if form.cleaned_data['location']:
+            rooms = rooms.filter(location=form.cleaned_data['location'])
+        return rooms
+
+
+class HistoryApiView(ApiListView):
+    fields = {'id': 'id', 'date': 'date', 'time_start': 'time_start', 'location_name': 'location__name',
+              'user_main_username': 'user_main__username', 'user_partner_username': 'user_partner__username',
+              'user_main_score': 'score__user_main_score', 'user_partner_score': 'score__user_partner_score'}
+    ordering = ('date', 'id')
+
+    def get_queryset(self):
+        return Reservation.objects.history_of(self.request.user)
+
+    def get_version(self):
+        # The same per-player version the calendar feed uses, bumped by Reservation and Score changes.
+        return ical.feed_etag(self.request.user.pk)
+
+
+class SportCentresApiView(ApiListView):
+    fields = {'id': 'id', 'name': 'name', 'slug': 'slug', 'address': 'address',
+              'phone_number': 'phone_number', 'domain': 'domain'}
+    ordering = ('name', 'id')
+    login_required = False
+
+    def get_queryset(self):
+        return SportCenter.objects.all()
+
+    def get_version(self):
+        return page_cache.generations([page_cache.SPORT_CENTRES])[0]
+
+
+class StandingsApiView(ApiListView):
+    fields = {'id': 'id', 'user_id': 'user_id', 'username': 'user__username', 'ranking': 'ranking',
+              'games_played': 'games_played', 'games_won': 'games_won', 'games_lost': 'games_lost',
+              'sets_won': 'sets_won', 'sets_lost': 'sets_lost'}
+    default_fields = ('user_id', 'username', 'ranking', 'games_played', 'games_won', 'games_lost')
+    ordering = ('-ranking', '-id')
+    login_required = False
+
+    def get_queryset(self):
+        return UserStats.objects.filter(user__skill=self.kwargs['skill'])
+
+    def get_version(self):
+        return leaderboard.version(int(self.kwargs['skill']))
+
+
+class JoinRoomApiView(View):
+    """``POST`` takes the free seat of an open room; of simultaneous requests exactly one gets a 200."""
+
+    def post(self, request, room_id):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Wymagane logowanie.'}, status=401)
+        room = Reservation.objects.filter(pk=room_id).first()
+        if room is None:
+            return JsonResponse({'error': 'Rezerwacja nie istnieje.'}, status=404)
+        if room.user_main_id == request.user.pk:
+            return JsonResponse({'error': 'Nie możesz dołączyć do własnej rezerwacji.'}, status=403)
+        if room.join(request.user):
+            return JsonResponse({'id': room.pk, 'user_partner_id': request.user.pk})
+        if room.date < datetime.date.today():
+            return JsonResponse({'error': 'Rezerwacja już się odbyła.'}, status=409)
+        return JsonResponse({'error': 'Ktoś inny dołączył już do tej rezerwacji.'}, status=409)
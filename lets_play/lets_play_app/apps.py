@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class LetsPlayAppConfig(AppConfig):
     name = 'lets_play_app'
+
+    def ready(self):
+        from . import analytics, ical, leaderboard, notifications, page_cache  # noqa: connects signal receivers
+        from .db import check_connections
+        if getattr(settings, 'DATABASE_HEALTH_CHECKS', False):
+            request_started.connect(check_connections)
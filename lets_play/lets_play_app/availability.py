@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import namedtuple, OrderedDict
+
+from django.db import transaction
+
+from .models import SportCenter, Reservation
+
+OPENING_TIME = datetime.time(10)
+CLOSING_TIME = datetime.time(23)
+SLOT_MINUTES = 60
+
+Slot = namedtuple('Slot', 'time_start time_end free')
+
+
+class CourtUnavailable(Exception):
+    pass
+
+
+def _minutes(time):
+    return time.hour * 60 + time.minute
+
+
+def _time(minutes):
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def occupancy(intervals):
+    """Sweep (start, end) minute intervals into sorted (start, end, courts_taken) segments."""
+    events = sorted([(start, 1) for start, end in intervals] + [(end, -1) for start, end in intervals])
+    segments = []
+    taken, previous = 0, None
+    for minute, delta in events:
+        if taken and minute > previous:
+            segments.append((previous, minute, taken))
+        taken += delta
+        previous = minute
+    return segments
+
+
+def peak(segments, start, end):
+    return max([taken for segment_start, segment_end, taken in segments
+                if segment_start < end and segment_end > start] or [0])
+
+
+def free_slots(segments, capacity):
+    slots = []
+    index = 0
+    for start in range(_minutes(OPENING_TIME), _minutes(CLOSING_TIME), SLOT_MINUTES):
+        end = start + SLOT_MINUTES
+        while index < len(segments) and segments[index][1] <= start:
+            index += 1
+        taken = 0
+        position = index
+        while position < len(segments) and segments[position][0] < end:
+            taken = max(taken, segments[position][2])
+            position += 1
+        slots.append(Slot(_time(start), _time(end), max(capacity - taken, 0)))
+    return slots
+
+
+def court_capacity(sport_center):
+    capacity = getattr(sport_center, 'capacity', None)
+    if capacity is None:
+        capacity = SportCenter.objects.with_capacity().values_list('capacity', flat=True).get(pk=sport_center.pk)
+    return capacity
+
+
+def week_grid(sport_center, start=None, days=7):
+    """Free courts per hourly slot for every day of the week, from one reservation query."""
+    start = start or datetime.date.today()
+    end = start + datetime.timedelta(days=days)
+    intervals = {start + datetime.timedelta(days=i): [] for i in range(days)}
+    reservations = Reservation.objects.filter(location=sport_center, date__gte=start, date__lt=end)\
+        .values_list('date', 'time_start', 'time_end')
+    for date, time_start, time_end in reservations:
+        intervals[date].append((_minutes(time_start), _minutes(time_end)))
+
+    capacity = court_capacity(sport_center)
+    return OrderedDict((date, free_slots(occupancy(intervals[date]), capacity)) for date in sorted(intervals))
+
+
+def book_court(user, location, date, time_start, time_end):
+    """Create a reservation unless every court of the centre is taken at some point of the interval."""
+    with transaction.atomic():
+        # Locking the centre row serializes concurrent bookings of the same centre.
+        sport_center = SportCenter.objects.select_for_update().get(pk=location.pk)
+        overlapping = Reservation.objects.filter(location=sport_center, date=date,
+                                                 time_start__lt=time_end, time_end__gt=time_start)\
+            .values_list('time_start', 'time_end')
+        segments = occupancy([(_minutes(start), _minutes(end)) for start, end in overlapping])
+        if peak(segments, _minutes(time_start), _minutes(time_end)) >= court_capacity(sport_center):
+            raise CourtUnavailable('Brak wolnych kortów w wybranym terminie.')
+        return Reservation.objects.create(user_main=user,
+                                          location=sport_center,
+                                          date=date,
+                                          time_start=time_start,
+                                          time_end=time_end)
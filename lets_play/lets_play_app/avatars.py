@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_SIZE = getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+MAX_PIXELS = getattr(settings, 'AVATAR_MAX_PIXELS', 24 * 1000 * 1000)
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF')
+STORED_SIZE = 512
+THUMBNAIL_SIZES = (40, 150)
+THUMBNAIL_DIR = 'avatars/thumbs'
+
+
+class InvalidAvatar(ValueError):
+    pass
+
+
+def _write_atomic(path, chunks, permissions=None):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    os.chmod(temporary, permissions or 0o644)
+    os.replace(temporary, path)
+
+
+@deconstructible
+class AvatarStorage(FileSystemStorage):
+    """Content-addressed storage: a file that already exists under its hash name is never written twice."""
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        path = self.path(name)
+        if not os.path.exists(path):
+            _write_atomic(path, content.chunks(), self.file_permissions_mode)
+        return name
+
+
+avatar_storage = AvatarStorage()
+
+
+def avatar_upload_to(instance, filename):
+    return 'avatars/%s/%s' % (filename[:2], filename)
+
+
+def _open(source):
+    try:
+        image = Image.open(source)
+        width, height = image.size
+    except (IOError, SyntaxError):
+        raise InvalidAvatar('Nieprawidłowy plik graficzny.')
+    if image.format not in ALLOWED_FORMATS:
+        raise InvalidAvatar('Dozwolone formaty to JPEG, PNG i GIF.')
+    # Only the header has been read so far, so oversized images are rejected before decoding.
+    if width * height > MAX_PIXELS:
+        raise InvalidAvatar('Obraz ma zbyt dużą rozdzielczość.')
+    return image
+
+
+def _to_rgb(image, size):
+    # JPEGs are decoded directly at a reduced scale instead of at full resolution.
+    image.draft('RGB', (size, size))
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def _jpeg(image):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def process_upload(upload):
+    """Validate an uploaded avatar and return it re-encoded as a JPEG named after the upload's SHA-256."""
+    if upload.size > MAX_UPLOAD_SIZE:
+        raise InvalidAvatar('Plik może mieć maksymalnie %s MB.' % (MAX_UPLOAD_SIZE // (1024 * 1024)))
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+
+    image = _to_rgb(_open(upload), STORED_SIZE)
+    image.thumbnail((STORED_SIZE, STORED_SIZE), Image.LANCZOS)
+    return ContentFile(_jpeg(image), name='%s.jpg' % digest.hexdigest())
+
+
+def get_thumbnail(name, size):
+    """Return the path of a square thumbnail of avatar ``name``, generating it on first use."""
+    if size not in THUMBNAIL_SIZES:
+        raise InvalidAvatar('Nieobsługiwany rozmiar miniatury.')
+    path = avatar_storage.path('%s/%s/%s.jpg' % (THUMBNAIL_DIR, size, name))
+    if not os.path.exists(path):
+        with open(avatar_storage.path(name), 'rb') as source:
+            image = _to_rgb(_open(source), size)
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        _write_atomic(path, [_jpeg(thumbnail)], avatar_storage.file_permissions_mode)
+    return path
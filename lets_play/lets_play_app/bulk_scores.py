@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Entering and confirming many scores at once, e.g. after a league night."""
+
+import csv
+import datetime
+import io
+
+from django.db import IntegrityError, transaction
+
+from . import analytics, ical, leaderboard
+from .models import Reservation, Score, UserStats, Notification
+from .notifications import notify_many
+
+CSV_COLUMNS = ('room_id', 'user_main_score', 'user_partner_score')
+MAX_SETS = 3
+# Rows shown on the organizer page; a CSV upload has no limit.
+PAGE_ROWS = 100
+
+
+class BulkScoreError(Exception):
+    def __init__(self, errors):
+        super(BulkScoreError, self).__init__('; '.join(errors))
+        self.errors = errors
+
+
+def unscored_rooms(limit=PAGE_ROWS):
+    """Played matches without a score, latest first."""
+    return list(Reservation.objects.filter(user_partner__isnull=False, date__lte=datetime.date.today(),
+                                           score__isnull=True)
+                .select_related('location', 'user_main', 'user_partner').order_by('-date', '-time_start')[:limit])
+
+
+def pending_scores(limit=PAGE_ROWS):
+    return list(Score.objects.exclude(is_confirmed_by_user_main=True, is_confirmed_by_user_partner=True)
+                .select_related('room__location', 'room__user_main', 'room__user_partner')
+                .order_by('room__date', 'room__time_start')[:limit])
+
+
+def parse_csv(upload):
+    """``(line, room_id, user_main_score, user_partner_score)`` rows of an uploaded CSV with a header line."""
+    try:
+        text = upload.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise BulkScoreError(['Plik musi być zapisany w UTF-8.'])
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise BulkScoreError(['Brak kolumn: %s.' % ', '.join(missing)])
+    rows, errors = [], []
+    for row in reader:
+        try:
+            rows.append((reader.line_num,) + tuple(int(row[column]) for column in CSV_COLUMNS))
+        except (TypeError, ValueError):
+            errors.append('Wiersz %s: wartości muszą być liczbami.' % reader.line_num)
+    if errors:
+        raise BulkScoreError(errors)
+    return rows
+
+
+def validate(rows):
+    """Check ``(line, room_id, main, partner)`` rows against each other and the reservations, in one query."""
+    rooms = {room_id: (user_partner_id, date, score_id) for room_id, user_partner_id, date, score_id in
+             Reservation.objects.filter(pk__in=[row[1] for row in rows])
+             .values_list('id', 'user_partner_id', 'date', 'score__id')}
+    today = datetime.date.today()
+    errors, seen = [], set()
+    for line, room_id, main_score, partner_score in rows:
+        if room_id not in rooms:
+            errors.append('Wiersz %s: rezerwacja %s nie istnieje.' % (line, room_id))
+            continue
+        user_partner_id, date, score_id = rooms[room_id]
+        if room_id in seen:
+            errors.append('Wiersz %s: rezerwacja %s powtarza się.' % (line, room_id))
+        elif user_partner_id is None:
+            errors.append('Wiersz %s: rezerwacja %s nie ma przeciwnika.' % (line, room_id))
+        elif date > today:
+            errors.append('Wiersz %s: mecz %s jeszcze się nie odbył.' % (line, room_id))
+        elif score_id is not None:
+            errors.append('Wiersz %s: wynik meczu %s jest już wpisany.' % (line, room_id))
+        elif not (0 <= main_score <= MAX_SETS and 0 <= partner_score <= MAX_SETS):
+            errors.append('Wiersz %s: liczba setów musi być od 0 do %s.' % (line, MAX_SETS))
+        elif main_score == partner_score:
+            errors.append('Wiersz %s: mecz nie może zakończyć się remisem.' % line)
+        seen.add(room_id)
+    if errors:
+        raise BulkScoreError(errors)
+
+
+def create(rows, confirmed=False):
+    """Validate and insert all scores in one transaction, or none of them; returns the new scores."""
+    validate(rows)
+    scores = [Score(room_id=room_id, user_main_score=main_score, user_partner_score=partner_score,
+                    is_confirmed_by_user_main=confirmed, is_confirmed_by_user_partner=confirmed)
+              for line, room_id, main_score, partner_score in rows]
+    with transaction.atomic():
+        try:
+            Score.objects.bulk_create(scores)
+        except IntegrityError:
+            raise BulkScoreError(['Ktoś wpisał w międzyczasie wynik jednego z meczów, spróbuj ponownie.'])
+        scores = list(Score.objects.filter(room_id__in=[row[1] for row in rows]).select_related('room'))
+        if confirmed:
+            confirmed_scores(scores)
+        else:
+            ical.invalidate(*players(scores))
+    return scores
+
+
+def confirm(score_ids):
+    """Confirm the given scores for both players with one UPDATE; returns the scores that were still pending."""
+    pending = Score.objects.filter(pk__in=score_ids)\
+        .exclude(is_confirmed_by_user_main=True, is_confirmed_by_user_partner=True)
+    with transaction.atomic():
+        # Locked like in Score.confirm(), so a score confirmed there meanwhile is not confirmed and announced twice.
+        scores = list(pending.select_for_update().select_related('room'))
+        pending.filter(pk__in=[score.pk for score in scores])\
+            .update(is_confirmed_by_user_main=True, is_confirmed_by_user_partner=True)
+        if scores:
+            confirmed_scores(scores)
+    return scores
+
+
+def players(scores):
+    return {user_id for score in scores for user_id in (score.room.user_main_id, score.room.user_partner_id)}
+
+
+def confirmed_scores(scores):
+    """One stats recompute, cache invalidation and notification batch for newly confirmed scores.
+
+    The counters are summed again from the database rather than incremented, so a score confirmed through
+    ``Score.confirm()`` at the same moment is not counted twice.
+    """
+    user_ids = players(scores)
+    # Ratings before the earliest of these matches stand, only the rest of the history is replayed.
+    moved = UserStats.objects.rebuild_players(user_ids, since=min(score.room.date for score in scores))
+    ical.invalidate(*user_ids)
+    analytics.invalidate(*user_ids)
+    leaderboard.invalidate_players(moved)
+    notify_many([Notification(user_id=user_id, event=Notification.SCORE_CONFIRMED, send_email=False,
+                              content="Wynik meczu %s %s został potwierdzony" % (score.room.date, score))
+                 for score in scores for user_id in (score.room.user_main_id, score.room.user_partner_id)])
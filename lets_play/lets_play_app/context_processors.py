@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import inbox
+
+
+def unread_messages(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_messages': 0}
+    return {'unread_messages': SimpleLazyObject(lambda: inbox.unread_count(user.pk))}
@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """Close persistent connections that stopped working while idle; the request then opens a fresh one.
+
+    Connected to ``request_started`` when ``DATABASE_HEALTH_CHECKS`` is on. A reused connection costs one
+    ``SELECT 1`` per request, still far cheaper than the TCP and authentication handshake it saves.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
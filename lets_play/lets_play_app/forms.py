@@ -4,7 +4,9 @@
 import datetime
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from django.core.files.images import get_image_dimensions
+from django.core.files.uploadedfile import UploadedFile
+from . import utilization
+from .avatars import process_upload, InvalidAvatar
 from .models import SportCenter, MyUser, Reservation, Score, SKILLS
 
 
@@ -52,6 +54,13 @@ class ScoreForm(forms.ModelForm):
         model = Score
         fields = ['user_main_score', 'user_partner_score']
 
+    def clean(self):
+        cleaned_data = super(ScoreForm, self).clean()
+        main_score = cleaned_data.get('user_main_score')
+        if main_score is not None and main_score == cleaned_data.get('user_partner_score'):
+            raise forms.ValidationError('Mecz nie może zakończyć się remisem.')
+        return cleaned_data
+
 class AcceptScoreForm(forms.Form):
     is_confirmed_by_user_partner = forms.TypedChoiceField(coerce=lambda x: x == 'True',
                                                        choices=((False, 'Odrzuć'), (True, 'Potwierdź')))
@@ -62,6 +71,9 @@ class AcceptScoreForm(forms.Form):
 
 
 class EditProfileForm(forms.ModelForm):
+    # A plain FileField: the upload is decoded once, by process_upload(), instead of also by ImageField.
+    avatar = forms.FileField(required=False, label='Avatar')
+
     class Meta:
         model = MyUser
         fields = ['first_name', 'last_name', 'email', 'skill', 'avatar']
@@ -71,38 +83,21 @@ class EditProfileForm(forms.ModelForm):
                   'skill': 'Ranga',
                   }
 
-    # def clean_avatar(self):
-    #     avatar = self.cleaned_data['avatar']
-    #
-    #     try:
-    #         w, h = get_image_dimensions(avatar)
-    #
-    #         #validate dimensions
-    #         max_width = max_height = 200
-    #         if w > max_width or h > max_height:
-    #             raise forms.ValidationError(
-    #                 u'Please use an image that is '
-    #                  '%s x %s pixels or smaller.' % (max_width, max_height))
-    #
-    #         #validate content type
-    #         main, sub = avatar.content_type.split('/')
-    #         if not (main == 'image' and sub in ['jpeg', 'pjpeg', 'gif', 'png']):
-    #             raise forms.ValidationError(u'Please use a JPEG, '
-    #                 'GIF or PNG image.')
-    #
-    #         #validate file size
-    #         if len(avatar) > (20 * 1024):
-    #             raise forms.ValidationError(
-    #                 u'Avatar file size may not exceed 20k.')
-    #
-    #     except AttributeError:
-    #         """
-    #         Handles case when we are updating the user profile
-    #         and do not supply a new avatar
-    #         """
-    #         pass
-    #
-    #     return avatar
+    def clean_avatar(self):
+        avatar = self.cleaned_data['avatar']
+        if isinstance(avatar, UploadedFile):
+            try:
+                avatar = process_upload(avatar)
+            except InvalidAvatar as error:
+                raise forms.ValidationError(str(error))
+        return avatar
+
+
+class RoomFilterForm(forms.Form):
+    date_start = forms.DateField(required=False)
+    date_end = forms.DateField(required=False)
+    location = forms.ModelChoiceField(queryset=SportCenter.objects.all(), required=False)
+    skill = forms.TypedChoiceField(choices=SKILLS, coerce=int, required=False, empty_value=None)
 
 
 class SearchRoomForm(forms.Form):
@@ -110,3 +105,58 @@ class SearchRoomForm(forms.Form):
     date_end = forms.DateField(widget=DateInput, label="Data końcowa")
     location = forms.ModelChoiceField(queryset=SportCenter.objects.all(), label="Lokalizacja")
     opponent_skill = forms.ChoiceField(choices=SKILLS, label="Poziom przeciwnika")
+
+
+class BulkScoreEntryForm(forms.Form):
+    """A pair of score fields for every match in ``rooms``; matches left empty are skipped."""
+    confirmed = forms.BooleanField(required=False, label="Potwierdź od razu")
+
+    def __init__(self, *args, **kwargs):
+        self.rooms = kwargs.pop('rooms')
+        super(BulkScoreEntryForm, self).__init__(*args, **kwargs)
+        choices = [('', '-')] + [(i, i) for i in range(4)]
+        for room in self.rooms:
+            for side in ('main', 'partner'):
+                self.fields['%s_%s' % (side, room.pk)] = forms.TypedChoiceField(
+                    choices=choices, coerce=int, required=False, empty_value=None)
+
+    def room_fields(self):
+        return [(room, self['main_%s' % room.pk], self['partner_%s' % room.pk]) for room in self.rooms]
+
+    def clean(self):
+        cleaned_data = super(BulkScoreEntryForm, self).clean()
+        rows = []
+        for line, room in enumerate(self.rooms, 1):
+            scores = (cleaned_data.get('main_%s' % room.pk), cleaned_data.get('partner_%s' % room.pk))
+            if scores == (None, None):
+                continue
+            if None in scores:
+                raise forms.ValidationError('Wiersz %s: wpisz wynik obu graczy.' % line)
+            rows.append((line, room.pk) + scores)
+        if not rows:
+            raise forms.ValidationError('Nie wpisano żadnego wyniku.')
+        cleaned_data['rows'] = rows
+        return cleaned_data
+
+
+class BulkScoreUploadForm(forms.Form):
+    csv_file = forms.FileField(label="Plik CSV (room_id, user_main_score, user_partner_score)")
+    confirmed = forms.BooleanField(required=False, label="Potwierdź od razu")
+
+
+class BulkConfirmForm(forms.Form):
+    scores = forms.ModelMultipleChoiceField(queryset=Score.objects.all())
+
+
+class UtilizationForm(forms.Form):
+    date_start = forms.DateField(widget=DateInput, label="Od", required=False)
+    date_end = forms.DateField(widget=DateInput, label="Do", required=False)
+
+    def clean(self):
+        cleaned_data = super(UtilizationForm, self).clean()
+        default_start, default_end = utilization.default_period()
+        cleaned_data['date_start'] = cleaned_data.get('date_start') or default_start
+        cleaned_data['date_end'] = cleaned_data.get('date_end') or default_end
+        if cleaned_data['date_end'] < cleaned_data['date_start']:
+            raise forms.ValidationError('Data końcowa musi być późniejsza niż początkowa.')
+        return cleaned_data
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Removal of data nobody reads any more, in short primary key ranges so live traffic never waits on a lock.
+
+Every batch repeats its conditions in the DELETE itself, so a room joined after its batch was read is left
+alone and two overlapping runs only find fewer rows to delete.
+"""
+
+import datetime
+import time
+from collections import namedtuple
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from . import ical, page_cache
+from .models import Reservation, Score, Messages
+
+BATCH_SIZE = 1000
+MESSAGES_RETENTION_DAYS = 90
+
+
+class Report(namedtuple('Report', 'task rows batches seconds')):
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def pk_ranges(queryset, batch_size):
+    """Half-open ``[start, end)`` ranges of ``batch_size`` primary keys covering the rows of ``queryset``."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        yield start, start + batch_size
+
+
+def _run(task, batches, delete_batch, pause):
+    started = time.perf_counter()
+    rows = count = 0
+    for batch in batches:
+        rows += delete_batch(*batch)
+        count += 1
+        if pause:
+            time.sleep(pause)
+    return Report(task, rows, count, time.perf_counter() - started)
+
+
+def delete_expired_rooms(today=None, batch_size=BATCH_SIZE, pause=0):
+    """Delete open rooms whose day has passed without anybody joining them."""
+    today = today or datetime.date.today()
+    expired = Reservation.objects.open().filter(date__lt=today, score__isnull=True)
+    # Plain SQL: a queryset delete would load every row to send post_delete.
+    sql = 'DELETE FROM {room} WHERE id >= %s AND id < %s AND user_partner_id IS NULL AND date < %s ' \
+          'AND NOT EXISTS (SELECT 1 FROM {score} WHERE {score}.room_id = {room}.id)'.format(
+              room=connection.ops.quote_name(Reservation._meta.db_table),
+              score=connection.ops.quote_name(Score._meta.db_table))
+
+    def delete_batch(start, end):
+        affected = list(expired.filter(pk__gte=start, pk__lt=end)
+                        .values_list('user_main_id', 'location__slug').distinct())
+        if not affected:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [start, end, today])
+            deleted = cursor.rowcount
+        # The hosts' calendars and the centres' pages are invalidated here, as post_delete would have done.
+        ical.invalidate(*{user_id for user_id, slug in affected})
+        page_cache.invalidate(*{page_cache.sport_center_scope(slug) for user_id, slug in affected})
+        return deleted
+
+    return _run('rooms', pk_ranges(expired, batch_size), delete_batch, pause)
+
+
+def delete_read_messages(days=MESSAGES_RETENTION_DAYS, batch_size=BATCH_SIZE, pause=0):
+    """Delete messages read and older than ``days``; unread ones stay whatever their age."""
+    old = Messages.objects.filter(is_read=True, date__lt=timezone.now() - datetime.timedelta(days=days))
+
+    def delete_batch(start, end):
+        # Messages have no delete signals, so this is a single DELETE.
+        deleted, per_model = old.filter(pk__gte=start, pk__lt=end).delete()
+        return deleted
+
+    return _run('messages', pk_ranges(old, batch_size), delete_batch, pause)
+
+
+def clear_expired_sessions(batch_size=BATCH_SIZE, pause=0):
+    """Delete expired database sessions in batches; other session engines clear themselves in one call."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if not issubclass(store, DatabaseSessionStore):
+        return _run('sessions', [()], lambda: store.clear_expired() or 0, pause=0)
+    model = store.get_model_class()
+    expired = model.objects.filter(expire_date__lt=timezone.now())
+
+    def batches():
+        # Session keys are strings, so batches are cut from the expire_date index instead of key ranges.
+        while True:
+            keys = list(expired.order_by('expire_date').values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return
+            yield (keys,)
+
+    def delete_batch(keys):
+        deleted, per_model = expired.filter(session_key__in=keys).delete()
+        return deleted
+
+    return _run('sessions', batches(), delete_batch, pause)
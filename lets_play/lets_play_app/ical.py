@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+import time
+from itertools import chain
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Reservation, Score
+from .signals import reservation_joined
+
+SIGNER_SALT = 'lets_play_app.ical'
+PRODUCT_ID = '-//Squash League//Lets Play//PL'
+LINE_LENGTH = 75
+
+
+def feed_token(user):
+    """Secret part of a player's feed URL; calendar clients cannot log in, so the URL itself authenticates."""
+    return signing.Signer(salt=SIGNER_SALT).sign(str(user.pk))
+
+
+def user_id_from_token(token):
+    try:
+        return int(signing.Signer(salt=SIGNER_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _version_key(user_id):
+    return 'ical:%s:version' % user_id
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Time based so an evicted version never matches an ETag handed out before.
+        cache.add(_version_key(user_id), int(time.time() * 1000), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate(*user_ids):
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), int(time.time() * 1000), None)
+
+
+def feed_etag(user_id):
+    # Games move from upcoming to history at midnight, so the day is part of the tag as well.
+    return hashlib.md5(('%s:%s:%s' % (user_id, _version(user_id), datetime.date.today())).encode()).hexdigest()
+
+
+def _escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Split a content line into 75 octet pieces as RFC 5545 requires."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= LINE_LENGTH:
+        return line + '\r\n'
+    pieces, start = [], 0
+    while start < len(encoded):
+        end = min(start + (LINE_LENGTH if not pieces else LINE_LENGTH - 1), len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1  # never cut a multi-byte character in half
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start = end
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _utc(date, time_of_day):
+    moment = timezone.make_aware(datetime.datetime.combine(date, time_of_day))
+    return moment.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event(reservation, user, stamp):
+    opponent = reservation.user_partner if reservation.user_main_id == user.pk else reservation.user_main
+    lines = ['BEGIN:VEVENT',
+             'UID:reservation-%s@lets-play' % reservation.pk,
+             'DTSTAMP:%s' % stamp,
+             'DTSTART:%s' % _utc(reservation.date, reservation.time_start),
+             'DTEND:%s' % _utc(reservation.date, reservation.time_end),
+             'SUMMARY:%s' % _escape('Squash: %s' % opponent if opponent else 'Squash (bez przeciwnika)'),
+             'LOCATION:%s' % _escape('%s, %s' % (reservation.location.name, reservation.location.address))]
+    try:
+        lines.append('DESCRIPTION:%s' % _escape('Wynik %s : %s' % (
+            reservation.score.user_main_score, reservation.score.user_partner_score)))
+    except Score.DoesNotExist:
+        pass
+    if reservation.comment:
+        lines.append('COMMENT:%s' % _escape(reservation.comment))
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def games(user):
+    """Upcoming games, today's games and history, read with iterator() so long histories are never in memory."""
+    upcoming = Reservation.objects.upcoming_games_of(user).for_listing().order_by('date', 'time_start')
+    today = Reservation.objects.with_user(user).for_listing().filter(user_partner__isnull=False,
+                                                                     date=datetime.date.today())
+    history = Reservation.objects.history_of(user).for_listing()
+    return chain(upcoming.iterator(), today.iterator(), history.iterator())
+
+
+def feed(user):
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(_fold(line) for line in ('BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:%s' % PRODUCT_ID,
+                                           'CALSCALE:GREGORIAN', 'X-WR-CALNAME:Squash League'))
+    for reservation in games(user):
+        yield event(reservation, user, stamp)
+    yield _fold('END:VCALENDAR')
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_players_feeds(sender, instance, **kwargs):
+    invalidate(instance.user_main_id, instance.user_partner_id)
+
+
+@receiver(reservation_joined)
+def invalidate_joined_feeds(sender, reservation, **kwargs):
+    invalidate(reservation.user_main_id, reservation.user_partner_id)
+
+
+@receiver(post_save, sender=Score)
+@receiver(post_delete, sender=Score)
+def invalidate_score_feeds(sender, instance, **kwargs):
+    invalidate(*Reservation.objects.filter(pk=instance.room_id).values_list('user_main_id', 'user_partner_id').first()
+               or ())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import MyUser, Messages
+
+CACHE_TIMEOUT = getattr(settings, 'UNREAD_MESSAGES_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _key(user_id):
+    return 'inbox:unread:%s' % user_id
+
+
+def unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Messages.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(_key(user_id), count, CACHE_TIMEOUT)
+    return count
+
+
+def messages_created(user_ids):
+    """Bump the cached counters after new messages were committed; missing counters are rebuilt on next read."""
+    for user_id, count in Counter(user_ids).items():
+        try:
+            cache.incr(_key(user_id), count)
+        except ValueError:
+            pass
+
+
+def invalidate(*user_ids):
+    """Forget the counters of ``user_ids`` after their messages changed in bulk; they are recounted on next read."""
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def mark_read(user, message_ids):
+    """Mark the given messages of ``user`` read and take them off the cached counter."""
+    count = Messages.objects.filter(user=user, pk__in=message_ids, is_read=False).update(is_read=True)
+    if count:
+        try:
+            if cache.decr(_key(user.pk), count) < 0:
+                # Messages read concurrently were taken off twice, let the next read recount.
+                cache.delete(_key(user.pk))
+        except ValueError:
+            pass
+
+
+def reconcile(batch_size=1000):
+    """Overwrite every player's cached counter with the database count, returns the number of players."""
+    unread = dict(Messages.objects.filter(is_read=False).values_list('user_id').annotate(count=Count('id')))
+    user_ids = list(MyUser.objects.values_list('id', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        cache.set_many({_key(user_id): unread.get(user_id, 0) for user_id in user_ids[start:start + batch_size]},
+                       CACHE_TIMEOUT)
+    return len(user_ids)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
+
+from .models import MyUser
+from .ratings import INITIAL_RATING
+from .signals import score_confirmed
+
+PAGE_SIZE = 50
+CACHE_TIMEOUT = getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 60 * 60)
+# Longest a rebuild may take before another request is let to start one.
+REBUILD_TIMEOUT = 60
+
+Standing = namedtuple('Standing', 'rank user_id username ranking games_played games_won')
+LeaderboardPage = namedtuple('LeaderboardPage', 'skill number num_pages count standings')
+
+
+def _version_key(skill):
+    return 'leaderboard:%s:version' % skill
+
+
+def _count_key(skill, version):
+    return 'leaderboard:%s:%s:count' % (skill, version)
+
+
+def _page_key(skill, version, number):
+    return 'leaderboard:%s:%s:page:%s' % (skill, version, number)
+
+
+def _built_key(skill):
+    return 'leaderboard:%s:built' % skill
+
+
+def _rebuild_key(skill, version):
+    return 'leaderboard:%s:%s:rebuild' % (skill, version)
+
+
+def _new_version():
+    # Time based so an evicted version key never resurrects an old snapshot.
+    return int(time.time() * 1000)
+
+
+def version(skill):
+    """Changes whenever the standings of the tier may have changed."""
+    current = cache.get(_version_key(skill))
+    if current is None:
+        cache.add(_version_key(skill), _new_version(), None)
+        current = cache.get(_version_key(skill))
+    return current
+
+
+def build_snapshot(skill, version):
+    """Rank every player of a skill tier and store the result in cache page by page."""
+    # Players without stats have not played yet and stand at the initial rating.
+    rows = MyUser.objects.filter(skill=skill)\
+        .annotate(current_ranking=Coalesce('stats__ranking', Value(int(INITIAL_RATING))))\
+        .order_by('-current_ranking', F('stats__games_won').desc(nulls_last=True), 'username')\
+        .values_list('id', 'username', 'current_ranking', 'stats__games_played', 'stats__games_won')
+
+    standings = []
+    rank, previous = 0, None
+    for position, (user_id, username, ranking, games_played, games_won) in enumerate(rows.iterator(), 1):
+        if ranking != previous:
+            rank, previous = position, ranking
+        standings.append(Standing(rank, user_id, username, ranking, games_played or 0, games_won or 0))
+
+    pages = {_count_key(skill, version): len(standings), _built_key(skill): version}
+    for start in range(0, len(standings), PAGE_SIZE):
+        pages[_page_key(skill, version, start // PAGE_SIZE + 1)] = standings[start:start + PAGE_SIZE]
+    cache.set_many(pages, CACHE_TIMEOUT)
+    return standings
+
+
+def _snapshot(skill):
+    """Return the version and count of the snapshot to read, and its standings when this call built it.
+
+    After an invalidation only the request that takes the rebuild lock ranks the tier again; the others keep serving
+    the last complete snapshot meanwhile, and build one themselves only when there is none.
+    """
+    current = version(skill)
+    count = cache.get(_count_key(skill, current))
+    if count is not None:
+        return current, count, None
+    if not cache.add(_rebuild_key(skill, current), True, REBUILD_TIMEOUT):
+        built = cache.get(_built_key(skill))
+        count = cache.get(_count_key(skill, built)) if built is not None else None
+        if count is not None:
+            return built, count, None
+        standings = build_snapshot(skill, current)
+    else:
+        try:
+            standings = build_snapshot(skill, current)
+        finally:
+            cache.delete(_rebuild_key(skill, current))
+    return current, len(standings), standings
+
+
+def get_page(skill, number=1):
+    snapshot_version, count, standings = _snapshot(skill)
+    num_pages = max(1, -(-count // PAGE_SIZE))
+    number = min(max(1, number), num_pages)
+    if standings is not None:
+        page = standings[(number - 1) * PAGE_SIZE:number * PAGE_SIZE]
+    else:
+        page = cache.get(_page_key(skill, snapshot_version, number))
+        if page is None:
+            page = build_snapshot(skill, snapshot_version)[(number - 1) * PAGE_SIZE:number * PAGE_SIZE]
+    return LeaderboardPage(skill, number, num_pages, count, page)
+
+
+def invalidate(*skills):
+    for skill in set(skills):
+        if skill is None:
+            continue
+        try:
+            cache.incr(_version_key(skill))
+        except ValueError:
+            cache.set(_version_key(skill), _new_version(), None)
+
+
+def invalidate_players(user_ids, batch_size=500):
+    """Invalidate the tiers of the given players only."""
+    user_ids = list(user_ids)
+    skills = set()
+    for start in range(0, len(user_ids), batch_size):
+        skills.update(MyUser.objects.filter(pk__in=user_ids[start:start + batch_size])
+                      .values_list('skill', flat=True).distinct())
+    invalidate(*skills)
+
+
+@receiver(score_confirmed)
+def invalidate_players_tiers(sender, score, **kwargs):
+    invalidate_players([score.room.user_main_id, score.room.user_partner_id])
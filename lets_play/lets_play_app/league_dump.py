@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Streaming NDJSON export and import of the league tables, for moving production-sized data between databases.
+
+Every line is ``{"model": "lets_play_app.score", "fields": {...}}`` with the column values by attribute name,
+so foreign keys appear as ``room_id``. Export reads each table with ``.iterator()`` and import inserts batches,
+so neither ever holds more than one batch in memory.
+"""
+
+import datetime
+import gzip
+import json
+import time
+from collections import namedtuple, OrderedDict
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .models import MyUser, SportCenter, Rooms, SquashCourt, Reservation, Score, UserStats, RatingHistory, Messages
+
+# In dependency order, although foreign keys are only checked once everything is in.
+MODELS = (MyUser, SportCenter, Rooms, SquashCourt, Reservation, Score, UserStats, RatingHistory, Messages)
+BATCH_SIZE = 1000
+
+
+class Throughput(namedtuple('Throughput', 'label rows seconds')):
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class DumpError(Exception):
+    pass
+
+
+class _Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts times to milliseconds, a dump has to give back exactly what it read.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(_Encoder, self).default(o)
+
+
+def open_dump(path, mode):
+    """Open ``path`` as text, gzip compressed when it ends with ``.gz``."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+def export(output, models=MODELS):
+    """Write every row of ``models`` to the ``output`` text stream; returns a Throughput per model."""
+    results = []
+    for model in models:
+        started = time.perf_counter()
+        names = [field.attname for field in model._meta.concrete_fields]
+        label = _label(model)
+        rows = 0
+        for values in model._base_manager.order_by('pk').values_list(*names).iterator():
+            output.write(json.dumps({'model': label, 'fields': dict(zip(names, values))}, cls=_Encoder,
+                                    ensure_ascii=False))
+            output.write('\n')
+            rows += 1
+        results.append(Throughput(label, rows, time.perf_counter() - started))
+    return results
+
+
+class _Table(object):
+    """Buffers the rows of one model and inserts each batch with multi-row INSERTs, never one statement per row."""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        self.sql = 'INSERT INTO %s (%s) VALUES ' % (
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in self.fields))
+        self.placeholders = '(%s)' % ', '.join(['%s'] * len(self.fields))
+        self.pending = []
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, values):
+        self.pending.append([field.get_db_prep_save(field.to_python(values.get(field.attname)), connection)
+                             for field in self.fields])
+
+    def flush(self, cursor):
+        if not self.pending:
+            return
+        # As many rows per INSERT as the backend takes parameters, e.g. 999 on sqlite.
+        size = connection.ops.bulk_batch_size(self.fields, self.pending)
+        for start in range(0, len(self.pending), size):
+            batch = self.pending[start:start + size]
+            cursor.execute(self.sql + ', '.join([self.placeholders] * len(batch)),
+                           [value for row in batch for value in row])
+        self.rows += len(self.pending)
+        self.pending = []
+
+
+def load(lines, models=MODELS, batch_size=BATCH_SIZE):
+    """Insert the rows of an NDJSON dump into empty tables in one transaction; returns a Throughput per model.
+
+    Rows are written as they are, without ``pre_save``, so ``auto_now_add`` dates and primary keys survive;
+    foreign keys are checked after the last row and the primary key sequences are moved past the imported ids.
+    """
+    tables = OrderedDict((_label(model), _Table(model)) for model in models)
+    not_empty = [label for label, table in tables.items() if table.model._base_manager.exists()]
+    if not_empty:
+        raise DumpError('Tabele nie są puste: %s.' % ', '.join(sorted(not_empty)))
+
+    last = time.perf_counter()
+    with transaction.atomic():
+        with connection.constraint_checks_disabled(), connection.cursor() as cursor:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    table = tables[row['model']]
+                except (ValueError, KeyError):
+                    raise DumpError('Wiersz %s: nieprawidłowy rekord.' % number)
+                table.add(row['fields'])
+                if len(table.pending) >= batch_size:
+                    table.flush(cursor)
+                now = time.perf_counter()
+                table.seconds += now - last
+                last = now
+            for table in tables.values():
+                table.flush(cursor)
+        connection.check_constraints(table_names=[model._meta.db_table for model in models])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+    return [Throughput(label, table.rows, table.seconds) for label, table in tables.items()]
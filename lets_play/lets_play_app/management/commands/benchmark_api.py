@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from .benchmark_views import Command as BenchmarkViewsCommand, percentile
+
+# JSON endpoint and the HTML page it replaces for scraping clients.
+PAIRS = (
+    ('api_rooms', 'reservations_list', {}),
+    ('api_history', 'user_history', {}),
+    ('api_sport_centres', 'create_room', {}),
+    ('api_standings', 'leaderboard_tier', {'skill': 'skill'}),
+)
+
+
+class Command(BenchmarkViewsCommand):
+    help = "Compare latency, queries and bytes per request of the JSON API with the HTML views it replaces."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--user', help="Username to log in as (defaults to the most active player).")
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # already set up by the test runner
+        user = self.get_user(options['user'])
+        client = Client()
+        client.force_login(user)
+        values = {'skill': user.skill or 1}
+
+        self.stdout.write('%-20s %-18s %11s %8s %13s %10s' % ('api', 'html', 'p50 ms', 'queries', 'bytes', '304 ms'))
+        for api_name, html_name, arguments in PAIRS:
+            kwargs = {key: values[value] for key, value in arguments.items()}
+            api = self.measure(client, reverse(api_name, kwargs=kwargs), options['repeat'])
+            html = self.measure(client, reverse(html_name, kwargs=kwargs), options['repeat'])
+            self.stdout.write('%-20s %-18s %5.1f/%-5.1f %4s/%-3s %6s/%-6s %10.2f' % (
+                api_name, html_name, api['p50_ms'], html['p50_ms'], api['queries'], html['queries'],
+                api['bytes'], html['bytes'], api['not_modified_ms']))
+
+    def measure(self, client, url, repeat):
+        timings, not_modified = [], []
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            # Read now, every request started resets the connection's query log.
+            query_count = len(queries)
+            if response.has_header('ETag'):
+                started = time.perf_counter()
+                client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                not_modified.append((time.perf_counter() - started) * 1000)
+        return {'p50_ms': percentile(timings, 0.5),
+                'queries': query_count,
+                'bytes': len(response.content),
+                'not_modified_ms': percentile(not_modified, 0.5) if not_modified else 0.0}
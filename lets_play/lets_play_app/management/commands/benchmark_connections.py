@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from lets_play_app.db import check_connections
+
+from .benchmark_views import percentile
+
+# (label, CONN_MAX_AGE, health checks)
+PROFILES = (
+    ('per request', 0, False),
+    ('persistent', 600, False),
+    ('persistent + checks', 600, True),
+)
+
+
+class Command(BaseCommand):
+    help = "Requests per second of one URL through the WSGI handler with a database connection per request " \
+           "and with persistent connections. Unlike the test client the handler closes connections as a server would."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', default='/api/sport_centres/')
+
+    def handle(self, *args, **options):
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        max_ages = {connection.alias: connection.settings_dict.get('CONN_MAX_AGE', 0)
+                    for connection in connections.all()}
+        health_checks = request_started.disconnect(check_connections)
+        connection_created.connect(count)
+        try:
+            with override_settings(REQUEST_METRICS_SAMPLE_RATE=0):
+                handler = WSGIHandler()
+                self.stdout.write('%-20s %10s %8s %8s %12s' % ('profile', 'req/s', 'p50 ms', 'p99 ms', 'connections'))
+                for label, max_age, checks in PROFILES:
+                    self.configure(max_age, checks)
+                    del opened[:]
+                    timings = self.measure(handler, options['path'], options['requests'])
+                    self.stdout.write('%-20s %10.0f %8.2f %8.2f %12s' % (
+                        label, len(timings) / (sum(timings) / 1000), percentile(timings, 0.5),
+                        percentile(timings, 0.99), len(opened)))
+        finally:
+            connection_created.disconnect(count)
+            request_started.disconnect(check_connections)
+            if health_checks:
+                request_started.connect(check_connections)
+            for connection in connections.all():
+                connection.settings_dict['CONN_MAX_AGE'] = max_ages[connection.alias]
+            connections.close_all()
+
+    def configure(self, max_age, checks):
+        connections.close_all()
+        for connection in connections.all():
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+        if checks:
+            request_started.connect(check_connections)
+        else:
+            request_started.disconnect(check_connections)
+
+    def measure(self, handler, path, requests):
+        timings = []
+        for i in range(requests):
+            environ = {'PATH_INFO': path, 'SERVER_NAME': '127.0.0.1', 'HTTP_HOST': '127.0.0.1',
+                       'wsgi.input': BytesIO()}
+            setup_testing_defaults(environ)
+            started = time.perf_counter()
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            # Sends request_finished, where Django closes connections older than CONN_MAX_AGE.
+            response.close()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
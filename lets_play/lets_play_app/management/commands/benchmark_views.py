@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import get_resolver, reverse
+
+from lets_play_app.models import MyUser, SportCenter, Reservation
+
+# Views that change state or need a one-time token are not benchmarked.
+SKIPPED = {'logout', 'delete_room', 'password_reset_confirm', 'api_join_room'}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Request every URL of lets_play/urls.py with the test client and write latency percentiles " \
+           "and query counts as a JSON report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--user', help="Username to log in as (defaults to the most active player).")
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help="Previous report to print the differences against.")
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # already set up by the test runner
+        user = self.get_user(options['user'])
+        client = Client()
+        client.force_login(user)
+
+        report = {'created': datetime.datetime.now().isoformat(),
+                  'database': connection.vendor,
+                  'repeat': options['repeat'],
+                  'views': {}}
+        for name, url in self.urls(user):
+            timings = []
+            for i in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+            report['views'][name] = {'url': url,
+                                     'status': response.status_code,
+                                     'queries': len(queries),
+                                     'p50_ms': round(percentile(timings, 0.5), 2),
+                                     'p90_ms': round(percentile(timings, 0.9), 2),
+                                     'p99_ms': round(percentile(timings, 0.99), 2),
+                                     'max_ms': round(max(timings), 2)}
+            self.stdout.write('%-28s %3s %4s queries  p50 %8.2f ms  p90 %8.2f ms' % (
+                name, response.status_code, len(queries),
+                report['views'][name]['p50_ms'], report['views'][name]['p90_ms']))
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
+
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def get_user(self, username):
+        if username:
+            try:
+                return MyUser.objects.get(username=username)
+            except MyUser.DoesNotExist:
+                raise CommandError('User "%s" does not exist.' % username)
+        user = MyUser.objects.annotate(games=Count('reservation')).order_by('-games').first()
+        if user is None:
+            raise CommandError('Database has no users, run generate_data first.')
+        return user
+
+    def urls(self, user):
+        sport_center = SportCenter.objects.exclude(slug=None).order_by('pk').first()
+        room = Reservation.objects.with_user(user).order_by('pk').first()
+        kwargs = {'user_id': user.pk,
+                  'skill': user.skill or 1,
+                  'slug': sport_center.slug if sport_center else None,
+                  'room_id': room.pk if room else None}
+
+        resolver = get_resolver()
+        for pattern in resolver.url_patterns:
+            name = getattr(pattern, 'name', None)
+            if hasattr(pattern, 'url_patterns') or name in SKIPPED:
+                continue
+            if name is None:
+                if not pattern.regex.groups:
+                    yield pattern.callback.__name__, '/' + pattern.regex.pattern.lstrip('^').rstrip('$')
+                continue
+            arguments = {key: kwargs.get(key) for key in pattern.regex.groupindex}
+            if None in arguments.values():
+                self.stdout.write('%-28s skipped, no data for %s' % (name, ', '.join(arguments)))
+                continue
+            yield name, reverse(name, kwargs=arguments)
+
+    def compare(self, path, report):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['views']
+        self.stdout.write('\n%-28s %14s %20s' % ('view', 'queries', 'p50 ms'))
+        for name, current in sorted(report['views'].items()):
+            before = previous.get(name)
+            if before is None:
+                continue
+            self.stdout.write('%-28s %6s -> %-5s %8.2f -> %-8.2f' % (
+                name, before['queries'], current['queries'], before['p50_ms'], current['p50_ms']))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from lets_play_app.models import MyUser, SportCenter, Reservation
+
+
+class Command(BaseCommand):
+    help = "Print the query plan (EXPLAIN ANALYZE on Postgres) of every reservation list view."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username the views are rendered for (defaults to the first user).")
+        parser.add_argument('--days', type=int, default=30, help="Date range used for the search query.")
+
+    def handle(self, *args, **options):
+        if options['user']:
+            try:
+                user = MyUser.objects.get(username=options['user'])
+            except MyUser.DoesNotExist:
+                raise CommandError('User "%s" does not exist.' % options['user'])
+        else:
+            user = MyUser.objects.order_by('pk').first()
+        location = SportCenter.objects.order_by('pk').first()
+        if user is None or location is None:
+            raise CommandError('Database needs at least one user and one sport center.')
+
+        today = datetime.date.today()
+        queries = [
+            ('JoinRoomView.get', Reservation.objects.joinable_by(user)),
+            ('JoinRoomView.post', Reservation.objects.search(user, today, today + datetime.timedelta(days=options['days']),
+                                                             location, user.skill)),
+            ('UserReservationsView', Reservation.objects.hosted_by(user)),
+            ('UserHistoryView', Reservation.objects.history_of(user)),
+            ('UserFutureGamesView', Reservation.objects.upcoming_games_of(user)),
+        ]
+        prefix = 'EXPLAIN ANALYZE' if connection.vendor == 'postgresql' else 'EXPLAIN QUERY PLAN'
+        for name, queryset in queries:
+            sql, params = queryset.for_listing().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('%s %s' % (prefix, sql), params)
+                rows = cursor.fetchall()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for row in rows:
+                self.stdout.write('  ' + ' '.join(str(column) for column in row))
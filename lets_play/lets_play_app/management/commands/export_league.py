@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from lets_play_app import league_dump
+
+
+class Command(BaseCommand):
+    help = "Stream the league tables to an NDJSON file (gzip compressed for a .gz name), for import_league."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with league_dump.open_dump(options['path'], 'w') as output:
+            results = league_dump.export(output)
+        write_throughput(self.stdout, results, time.perf_counter() - started)
+
+
+def write_throughput(stdout, results, seconds):
+    for result in results:
+        stdout.write('%-28s %9s rows %8.2fs %10.0f rows/s' % (result.label, result.rows, result.seconds, result.rate))
+    rows = sum(result.rows for result in results)
+    stdout.write('%-28s %9s rows %8.2fs %10.0f rows/s' % ('total', rows, seconds, rows / seconds if seconds else 0))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from lets_play_app.models import MyUser, SportCenter, Rooms, Reservation, Score, UserStats, Messages, SKILLS
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Generate realistic league data (players, centres, reservations, scores, messages) with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--centres', type=int, default=10)
+        parser.add_argument('--reservations', type=int, default=20000)
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=365, help="Reservations are spread over this many days "
+                                                                  "before and 30 days after today.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prefix', default='player', help="Username prefix, must be unique per run.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.time()
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        centre_ids = self.create_centres(options['centres'], options['prefix'])
+        self.create_reservations(options['reservations'], user_ids, centre_ids, options['days'])
+        self.create_messages(options['messages'], user_ids)
+        UserStats.objects.rebuild()
+
+        self.stdout.write(self.style.SUCCESS('Done in %.1fs.' % (time.time() - started)))
+
+    def bulk_create(self, model, objects):
+        count = 0
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        self.stdout.write('%s: %s rows' % (model.__name__, count))
+        return count
+
+    def create_users(self, count, prefix):
+        password = make_password('league123')
+        skills = [value for value, name in SKILLS]
+        self.bulk_create(MyUser, (MyUser(username='%s%s' % (prefix, i),
+                                         email='%s%s@example.com' % (prefix, i),
+                                         password=password,
+                                         skill=self.random.choice(skills)) for i in range(count)))
+        return list(MyUser.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+
+    def create_centres(self, count, prefix):
+        self.bulk_create(SportCenter, (SportCenter(name='%s centre %s' % (prefix, i),
+                                                   address='ul. Squashowa %s' % i,
+                                                   phone_number=self.random.randint(100000000, 999999999),
+                                                   domain='http://centre%s.example.com/' % i,
+                                                   slug='%s-centre-%s' % (prefix, i)) for i in range(count)))
+        centre_ids = list(SportCenter.objects.filter(slug__startswith='%s-centre-' % prefix)
+                          .values_list('id', flat=True))
+        self.bulk_create(Rooms, (Rooms(sport_center_id=centre_id, room_number=number)
+                                 for centre_id in centre_ids for number in range(self.random.randint(2, 6))))
+        return centre_ids
+
+    def reservation(self, user_ids, centre_ids, today, days):
+        date = today + datetime.timedelta(days=self.random.randint(-days, 30))
+        hour = self.random.randint(10, 21)
+        user_main = self.random.choice(user_ids)
+        user_partner = self.random.choice(user_ids)
+        joined = self.random.random() < (0.9 if date < today else 0.5)
+        if not joined or user_partner == user_main:
+            user_partner = None
+        return Reservation(user_main_id=user_main, user_partner_id=user_partner,
+                           date=date, time_start=datetime.time(hour),
+                           time_end=datetime.time(hour + self.random.choice([1, 1, 2])),
+                           location_id=self.random.choice(centre_ids))
+
+    def create_reservations(self, count, user_ids, centre_ids, days):
+        today = datetime.date.today()
+        last_id = Reservation.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        self.bulk_create(Reservation, (self.reservation(user_ids, centre_ids, today, days) for i in range(count)))
+
+        played = Reservation.objects.filter(id__gt=last_id, date__lt=today, user_partner__isnull=False)\
+            .values_list('id', flat=True)
+        self.bulk_create(Score, (self.score(room_id) for room_id in played.iterator() if self.random.random() < 0.9))
+
+    def score(self, room_id):
+        winner, looser = 3, self.random.randint(0, 2)
+        if self.random.random() < 0.5:
+            winner, looser = looser, winner
+        confirmed = self.random.random() < 0.8
+        return Score(room_id=room_id, user_main_score=winner, user_partner_score=looser,
+                     is_confirmed_by_user_main=True, is_confirmed_by_user_partner=confirmed)
+
+    def create_messages(self, count, user_ids):
+        self.bulk_create(Messages, (Messages(user_id=self.random.choice(user_ids),
+                                             content='Wiadomość testowa %s' % i) for i in range(count)))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lets_play_app import housekeeping
+
+TASKS = {'rooms': housekeeping.delete_expired_rooms,
+         'messages': housekeeping.delete_read_messages,
+         'sessions': housekeeping.clear_expired_sessions}
+
+
+class Command(BaseCommand):
+    help = "Delete expired unjoined rooms, old read messages and expired sessions in small batches; " \
+           "safe to run from cron next to live traffic."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tasks', nargs='*', help="Tasks to run out of %s, all by default." % ', '.join(sorted(TASKS)))
+        parser.add_argument('--batch-size', type=int, default=housekeeping.BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches, to leave the database to live traffic.")
+        parser.add_argument('--messages-days', type=int, default=housekeeping.MESSAGES_RETENTION_DAYS,
+                            help="Keep read messages younger than this many days.")
+
+    def handle(self, *args, **options):
+        unknown = sorted(set(options['tasks']) - set(TASKS))
+        if unknown:
+            raise CommandError('Unknown tasks: %s.' % ', '.join(unknown))
+        for task in options['tasks'] or sorted(TASKS):
+            kwargs = {'batch_size': options['batch_size'], 'pause': options['pause']}
+            if task == 'messages':
+                kwargs['days'] = options['messages_days']
+            report = TASKS[task](**kwargs)
+            self.stdout.write(self.style.SUCCESS('%-9s %8s rows in %4s batches, %6.2fs, %8.0f rows/s' % (
+                report.task, report.rows, report.batches, report.seconds, report.rate)))
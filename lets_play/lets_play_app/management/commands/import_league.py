@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from lets_play_app import league_dump
+from .export_league import write_throughput
+
+
+class Command(BaseCommand):
+    help = "Load an export_league NDJSON file into empty league tables in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=league_dump.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with league_dump.open_dump(options['path'], 'r') as lines:
+                results = league_dump.load(lines, batch_size=options['batch_size'])
+        except league_dump.DumpError as error:
+            raise CommandError(str(error))
+        # The rows went in without signals, so nothing cached about the old contents may be served.
+        cache.clear()
+        write_throughput(self.stdout, results, time.perf_counter() - started)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import setup_test_environment
+from django.views.static import serve
+
+from lets_play_app.wsgi_static import StaticFilesMiddleware, HASHED_NAME, CONTENT_ADDRESSED_NAME
+
+ASSET_URL = re.compile(r'(?:href|src)="([^"]+)"')
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def not_found(environ, start_response):
+    start_response('404 Not Found', [])
+    return []
+
+
+def wsgi_get(application, path, **headers):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    environ.update(('HTTP_%s' % key.upper(), value) for key, value in headers.items())
+    response = {}
+
+    def start_response(status, response_headers):
+        response['status'] = int(status.split()[0])
+        response['headers'] = dict(response_headers)
+
+    body = b''.join(application(environ, start_response))
+    return response['status'], response['headers'], len(body)
+
+
+class Command(BaseCommand):
+    help = "Count the local static/media requests and body bytes a page view costs, on a first and a repeat " \
+           "visit, with development and production asset serving."
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', default=['/'])
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # already set up by the test runner
+        self.stdout.write('%-30s %-12s %22s %22s' % ('page', 'mode', 'first visit', 'repeat visit'))
+        static_root = tempfile.mkdtemp()
+        try:
+            for url in options['urls']:
+                self.report(url, 'development', self.measure_development(url))
+            with override_settings(DEBUG=False, STATIC_ROOT=static_root,
+                                   STATICFILES_STORAGE='lets_play_app.storage.CompressedManifestStaticFilesStorage'):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                application = StaticFilesMiddleware(not_found, [
+                    (settings.STATIC_URL, static_root, HASHED_NAME),
+                    (settings.MEDIA_URL, settings.MEDIA_ROOT, CONTENT_ADDRESSED_NAME)])
+                for url in options['urls']:
+                    self.report(url, 'production', self.measure_production(url, application))
+        finally:
+            shutil.rmtree(static_root)
+
+    def report(self, url, mode, visits):
+        (first_requests, first_bytes), (repeat_requests, repeat_bytes) = visits
+        self.stdout.write('%-30s %-12s %4s req %10s B %4s req %10s B' % (
+            url, mode, first_requests, first_bytes, repeat_requests, repeat_bytes))
+
+    def assets(self, url):
+        content = Client().get(url).content.decode('utf-8')
+        return sorted(set(asset for asset in ASSET_URL.findall(content)
+                          if asset.startswith((settings.STATIC_URL, settings.MEDIA_URL))))
+
+    def measure_development(self, url):
+        """runserver/static() send no Cache-Control, so the browser revalidates every asset on each visit."""
+        factory = RequestFactory()
+        first, repeat = [0, 0], [0, 0]
+        for asset in self.assets(url):
+            if asset.startswith(settings.STATIC_URL):
+                name = asset[len(settings.STATIC_URL):]
+                path = finders.find(name)
+                if path is None:
+                    continue
+                root = path[:-len(name)]
+            else:
+                name, root = asset[len(settings.MEDIA_URL):], settings.MEDIA_ROOT
+                path = os.path.join(root, name)
+            response = serve(factory.get(asset), name, document_root=root)
+            first[0] += 1
+            first[1] += int(response['Content-Length'])
+            response = serve(factory.get(asset, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']),
+                             name, document_root=root)
+            repeat[0] += 1
+            repeat[1] += int(response.get('Content-Length', 0))
+        return first, repeat
+
+    def measure_production(self, url, application):
+        first, repeat = [0, 0], [0, 0]
+        for asset in self.assets(url):
+            status, headers, length = wsgi_get(application, asset, accept_encoding=ACCEPT_ENCODING)
+            if status != 200:
+                continue
+            first[0] += 1
+            first[1] += length
+            if 'immutable' in headers['Cache-Control']:
+                continue  # served from the browser cache without a request
+            status, headers, length = wsgi_get(application, asset, accept_encoding=ACCEPT_ENCODING,
+                                               if_none_match=headers['ETag'])
+            repeat[0] += 1
+            repeat[1] += length
+        return first, repeat
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from lets_play_app.notifications import process_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver notifications left in the outbox, e.g. after a crash."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        delivered = process_outbox(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Delivered %s notifications.' % delivered))
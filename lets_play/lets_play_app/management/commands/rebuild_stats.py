@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from lets_play_app import leaderboard
+from lets_play_app.models import UserStats, SKILLS
+
+
+class Command(BaseCommand):
+    help = "Recompute UserStats, ratings and the rating history of every player from confirmed scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ratings-only', action='store_true',
+                            help="Only replay ratings, keep the game and set counters.")
+
+    def handle(self, *args, **options):
+        started = time.time()
+        if options['ratings_only']:
+            count = UserStats.objects.replay_ratings().matches
+            self.stdout.write(self.style.SUCCESS('Replayed %s matches in %.1fs.' % (count, time.time() - started)))
+        else:
+            count = UserStats.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS('Rebuilt stats for %s players in %.1fs.' % (
+                count, time.time() - started)))
+        leaderboard.invalidate(*[skill for skill, name in SKILLS])
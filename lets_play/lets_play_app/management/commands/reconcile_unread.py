@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from lets_play_app import inbox
+
+
+class Command(BaseCommand):
+    help = "Reset the cached unread message counters from the database; run periodically."
+
+    def handle(self, *args, **options):
+        count = inbox.reconcile()
+        self.stdout.write(self.style.SUCCESS('Reconciled unread counters of %s players.' % count))
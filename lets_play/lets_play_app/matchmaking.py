@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import heapq
+from collections import Counter, namedtuple
+
+from django.db.models import Q, F, Case, When, Count, Value, IntegerField
+from django.db.models.functions import Coalesce
+
+from .models import Reservation, UserStats
+from .ratings import INITIAL_RATING
+
+HORIZON_DAYS = 30
+MAX_SKILL_DISTANCE = 1
+# Rating points; further apart the ranking term alone costs more than a week's wait.
+MAX_RANKING_DISTANCE = 200
+# Upper bound of rows read per call; the nearest dates are read first and those are the cheapest anyway.
+CANDIDATE_LIMIT = 1000
+PREFERRED_CENTRES = 3
+
+# Cost of a candidate, lower is better.
+SKILL_WEIGHT = 3.0
+RANKING_WEIGHT = 0.01
+DAY_WEIGHT = 1.0 / 7
+OTHER_CENTRE_WEIGHT = 1.0
+REMATCH_WEIGHT = 0.5
+MAX_REMATCH_PENALTY = 4
+
+Match = namedtuple('Match', 'cost reservation_id skill_distance ranking_distance days_away preferred games_played')
+
+
+def finished_games(user):
+    return Reservation.objects.with_user(user).filter(user_partner__isnull=False, date__lt=datetime.date.today())
+
+
+def preferred_centres(user, limit=PREFERRED_CENTRES):
+    """The centres the player finished most games at, most played first, counted in the database."""
+    rows = finished_games(user).values('location_id').annotate(games=Count('id')).order_by('-games', 'location_id')
+    return [row['location_id'] for row in rows[:limit]]
+
+
+def games_against(user, host_ids):
+    """How many finished games the player had against each of ``host_ids``, a list or a subquery of ids."""
+    opponent = Case(When(user_main_id=user.pk, then=F('user_partner_id')), default=F('user_main_id'),
+                    output_field=IntegerField())
+    rows = finished_games(user)\
+        .filter(Q(user_main=user, user_partner_id__in=host_ids) | Q(user_partner=user, user_main_id__in=host_ids))\
+        .values(opponent=opponent).annotate(games=Count('id')).order_by()
+    return Counter({row['opponent']: row['games'] for row in rows})
+
+
+def open_rooms(user, ranking, today, horizon_days=HORIZON_DAYS):
+    """Open rooms in the horizon hosted by players of a close skill and ranking."""
+    rooms = Reservation.objects.open().exclude(user_main=user)\
+        .filter(date__gte=today, date__lt=today + datetime.timedelta(days=horizon_days))
+    if user.skill is not None:
+        rooms = rooms.filter(user_main__skill__range=(user.skill - MAX_SKILL_DISTANCE, user.skill + MAX_SKILL_DISTANCE))
+    # Hosts without stats have not played yet and stand at the initial rating.
+    return rooms.annotate(host_ranking=Coalesce('user_main__stats__ranking', Value(int(INITIAL_RATING))))\
+        .filter(host_ranking__range=(ranking - MAX_RANKING_DISTANCE, ranking + MAX_RANKING_DISTANCE))
+
+
+def candidates(user, ranking, today, horizon_days=HORIZON_DAYS):
+    """The nearest CANDIDATE_LIMIT rooms of ``open_rooms``.
+
+    Skill and ranking are filtered before the cap, so the rooms it drops are later in the horizon than every kept
+    one and differ from the player by no more than the kept ones can.
+    """
+    return open_rooms(user, ranking, today, horizon_days).order_by('date')\
+        .values_list('id', 'date', 'location_id', 'user_main_id', 'user_main__skill', 'host_ranking')\
+        [:CANDIDATE_LIMIT]
+
+
+def rank(user, limit=10, locations=None, horizon_days=HORIZON_DAYS):
+    """Return the ``limit`` best Matches for ``user``, best first.
+
+    ``locations`` are the preferred SportCenter ids, by default the centres the player played at most.
+    """
+    today = datetime.date.today()
+    ranking = UserStats.objects.filter(user=user).values_list('ranking', flat=True).first() or INITIAL_RATING
+    if locations is None:
+        locations = preferred_centres(user)
+    preferred = set(locations)
+    # A subquery of the hosts rather than a list of ids, which may outgrow the parameter limit of sqlite.
+    opponents = games_against(user, open_rooms(user, ranking, today, horizon_days).values('user_main_id'))
+    rows = candidates(user, ranking, today, horizon_days)
+
+    def score(row):
+        reservation_id, date, location_id, host_id, host_skill, host_ranking = row
+        skill_distance = abs(host_skill - user.skill) if None not in (host_skill, user.skill) else MAX_SKILL_DISTANCE
+        ranking_distance = abs(host_ranking - ranking)
+        days_away = (date - today).days
+        is_preferred = location_id in preferred
+        games_played = opponents[host_id]
+        cost = (SKILL_WEIGHT * skill_distance
+                + RANKING_WEIGHT * ranking_distance
+                + DAY_WEIGHT * days_away
+                + (0 if is_preferred else OTHER_CENTRE_WEIGHT)
+                + REMATCH_WEIGHT * min(games_played, MAX_REMATCH_PENALTY))
+        return Match(cost, reservation_id, skill_distance, ranking_distance, days_away, is_preferred, games_played)
+
+    return heapq.nsmallest(limit, (score(row) for row in rows))
+
+
+def suggested_reservations(user, limit=10, locations=None):
+    """Best matching open reservations for ``user``, each with its Match as ``reservation.match``."""
+    matches = rank(user, limit, locations)
+    reservations = Reservation.objects.for_listing().in_bulk([match.reservation_id for match in matches])
+    suggestions = []
+    for match in matches:
+        reservation = reservations.get(match.reservation_id)
+        if reservation is not None:
+            reservation.match = match
+            suggestions.append(reservation)
+    return suggestions
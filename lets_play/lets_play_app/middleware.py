@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import Template
+
+logger = logging.getLogger('lets_play.requests')
+
+_local = threading.local()
+_original_template_render = None
+
+
+class ExecuteWrapperCursor(object):
+    """Cursor passing every execute through ``wrapper(execute, sql, params, many, context)``."""
+
+    def __init__(self, cursor, connection, wrapper):
+        self.cursor = cursor
+        self.connection = connection
+        self.wrapper = wrapper
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def execute(self, sql, params=None):
+        return self.wrapper(self.cursor.execute, sql, params, False, {'connection': self.connection, 'cursor': self})
+
+    def executemany(self, sql, param_list):
+        return self.wrapper(self.cursor.executemany, sql, param_list, True, {'connection': self.connection, 'cursor': self})
+
+
+@contextmanager
+def execute_wrapper(connection, wrapper):
+    """``connection.execute_wrapper()`` of Django 2.0 for this Django.
+
+    Only the cursors the connection creates inside the block are wrapped; connecting, and the debug cursor, are
+    left to the queries themselves, so a view that runs none costs nothing.
+    """
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    # Instance attributes of this thread's connection shadow the methods only for the block.
+    connection.make_cursor = lambda cursor: ExecuteWrapperCursor(make_cursor(cursor), connection, wrapper)
+    connection.make_debug_cursor = lambda cursor: ExecuteWrapperCursor(make_debug_cursor(cursor), connection, wrapper)
+    try:
+        yield
+    finally:
+        del connection.make_cursor, connection.make_debug_cursor
+
+
+class QueryTimer(object):
+    def __init__(self):
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __len__(self):
+        return sum(self.statements.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.statements[sql] += 1
+
+
+def _timed_template_render(self, context=None, request=None):
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None or metrics.template_depth:
+        # Unsampled requests pay one attribute lookup; nested renders are counted by the outermost one.
+        return _original_template_render(self, context, request)
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_template_render(self, context, request)
+    finally:
+        metrics.template_seconds += time.perf_counter() - started
+        metrics.template_depth -= 1
+
+
+def instrument_templates():
+    """Time the renders of the Django template backend, which both render() and TemplateResponse go through."""
+    global _original_template_render
+    if _original_template_render is None:
+        _original_template_render = Template.render
+        Template.render = _timed_template_render
+
+
+class RequestMetrics(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = QueryTimer()
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def as_dict(self, finished):
+        duplicates = [(sql, count) for sql, count in self.queries.statements.most_common() if count > 1]
+        return {'total_ms': round((finished - self.started) * 1000, 2),
+                'db_queries': len(self.queries),
+                'db_ms': round(self.queries.seconds * 1000, 2),
+                'duplicate_queries': sum(count - 1 for sql, count in duplicates),
+                'duplicated_sql': [sql for sql, count in duplicates[:3]],
+                'template_ms': round(self.template_seconds * 1000, 2),
+                'view_ms': round((finished - self.view_started) * 1000, 2) if self.view_started is not None else 0.0}
+
+
+class RequestMetricsMiddleware(object):
+    """Log view name, wall time, DB, template and view time for a sample of requests and add a Server-Timing header.
+
+    The view time runs from ``process_view`` until the response is back here, templates included. A streamed
+    response is logged once its content is consumed, so the queries of the stream are counted, while its
+    Server-Timing header can only tell what happened before the first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+        instrument_templates()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        request.metrics = _local.metrics = metrics = RequestMetrics()
+        try:
+            with execute_wrapper(connection, metrics.queries):
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        timings = metrics.as_dict(time.perf_counter())
+        response['Server-Timing'] = 'db;dur=%.2f;desc="%s queries", tpl;dur=%.2f, view;dur=%.2f, total;dur=%.2f' % (
+            timings['db_ms'], timings['db_queries'], timings['template_ms'], timings['view_ms'],
+            timings['total_ms'])
+        if response.streaming:
+            response.streaming_content = self.stream(request, response, response.streaming_content, metrics)
+        else:
+            self.log(request, response, timings, streamed=False)
+        return response
+
+    def stream(self, request, response, content, metrics):
+        try:
+            with execute_wrapper(connection, metrics.queries):
+                for chunk in content:
+                    yield chunk
+        finally:
+            self.log(request, response, metrics.as_dict(time.perf_counter()), streamed=True)
+
+    def log(self, request, response, timings, streamed):
+        resolver_match = getattr(request, 'resolver_match', None)
+        record = {'view': resolver_match.view_name if resolver_match else None,
+                  'method': request.method,
+                  'path': request.path,
+                  'status': response.status_code,
+                  'streamed': streamed}
+        record.update(timings)
+        logger.info(json.dumps(record))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0008_auto_20180729_1833'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['location', 'date'], name='reservation_location_date'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user_main', 'date'], name='reservation_main_date'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user_partner', 'date'], name='reservation_partner_date'),
+        ),
+        # Open rooms only: JoinRoomView filters on user_partner IS NULL and sorts by date.
+        migrations.RunSQL(
+            ['CREATE INDEX reservation_open_date ON lets_play_app_reservation (date, user_main_id) '
+             'WHERE user_partner_id IS NULL'],
+            ['DROP INDEX reservation_open_date'],
+        ),
+    ]
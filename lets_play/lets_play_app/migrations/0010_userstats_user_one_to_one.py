@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+COUNTERS = ('games_played', 'games_won', 'games_lost', 'sets_won', 'sets_lost', 'ranking')
+
+
+def merge_duplicate_stats(apps, schema_editor):
+    # Concurrent get_or_create calls could give a player several rows, each holding part of their counters
+    # (the ranking counted wins too), so the counters are summed into the oldest row and the others deleted.
+    UserStats = apps.get_model('lets_play_app', 'UserStats')
+    duplicated = UserStats.objects.values('user_id')\
+        .annotate(rows=models.Count('id'), kept=models.Min('id'),
+                  **{'total_%s' % field: models.Sum(field) for field in COUNTERS})\
+        .filter(rows__gt=1).order_by()
+    for row in duplicated:
+        UserStats.objects.filter(pk=row['kept']).update(**{field: row['total_%s' % field] for field in COUNTERS})
+        UserStats.objects.filter(user_id=row['user_id']).exclude(pk=row['kept']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0009_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stats, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='userstats',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0012_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messages',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        # Unread messages only: counted per user by the inbox badge.
+        migrations.RunSQL(
+            ['CREATE INDEX messages_unread ON lets_play_app_messages (user_id) WHERE NOT is_read'],
+            ['DROP INDEX messages_unread'],
+        ),
+    ]
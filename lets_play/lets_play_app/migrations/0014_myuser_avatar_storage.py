@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import lets_play_app.avatars
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0013_messages_is_read'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='myuser',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=lets_play_app.avatars.AvatarStorage(), upload_to=lets_play_app.avatars.avatar_upload_to),
+        ),
+    ]
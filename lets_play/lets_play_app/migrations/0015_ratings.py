@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def reset_rankings(apps, schema_editor):
+    # Rankings used to count wins; everybody starts from the initial rating until `rebuild_stats` replays the league.
+    UserStats = apps.get_model('lets_play_app', 'UserStats')
+    UserStats.objects.update(ranking=1500, rating=1500.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0014_myuser_avatar_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='rating',
+            field=models.FloatField(default=1500.0),
+        ),
+        migrations.AlterField(
+            model_name='userstats',
+            name='ranking',
+            field=models.IntegerField(default=1500),
+        ),
+        migrations.CreateModel(
+            name='RatingHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rating', models.FloatField()),
+                ('rating_change', models.FloatField()),
+                ('score', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_history', to='lets_play_app.Score')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_history', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ratinghistory',
+            index=models.Index(fields=['user', 'date'], name='ratinghistory_user_date'),
+        ),
+        migrations.RunPython(reset_rankings, migrations.RunPython.noop),
+    ]
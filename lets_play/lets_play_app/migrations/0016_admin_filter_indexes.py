@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lets_play_app', '0015_ratings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='myuser',
+            name='skill',
+            field=models.IntegerField(choices=[(1, 'Szturmowiec'), (2, 'Padawan'), (3, 'Rycerz Jedi'),
+                                               (4, 'Mistrz Joda')], db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date'], name='reservation_date'),
+        ),
+    ]
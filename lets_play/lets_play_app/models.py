@@ -1,9 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*- 
 
-from django.conf.global_settings import MEDIA_ROOT
+import datetime
+import io
+from collections import namedtuple
+
+import numpy
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from . import ratings
+from .avatars import avatar_storage, avatar_upload_to
+from .signals import score_confirmed, reservation_joined
 
 
 
@@ -16,8 +27,29 @@ SKILLS = (
 
 
 class MyUser(AbstractUser):
-    skill = models.IntegerField(choices=SKILLS, null=True)
-    avatar = models.ImageField(null=True, blank=True, upload_to=MEDIA_ROOT)
+    skill = models.IntegerField(choices=SKILLS, null=True, db_index=True)
+    avatar = models.ImageField(null=True, blank=True, upload_to=avatar_upload_to, storage=avatar_storage)
+
+    @property
+    def avatar_thumbnail_url(self):
+        if self.avatar:
+            return reverse('avatar_thumbnail', args=[150, self.avatar.name])
+
+
+def _court_count(model, **filters):
+    courts = model.objects.filter(sport_center=models.OuterRef('pk'), **filters).order_by()\
+        .values('sport_center').annotate(count=models.Count('pk')).values('count')
+    return Coalesce(models.Subquery(courts, output_field=models.IntegerField()), 0)
+
+
+class SportCenterQuerySet(models.QuerySet):
+    def with_capacity(self):
+        """Annotate the number of bookable courts: the available Rooms, or the SquashCourts of a centre with none."""
+        # Subqueries rather than joins, so the two court tables do not multiply each other's rows.
+        return self.annotate(rooms_count=_court_count(Rooms), open_rooms=_court_count(Rooms, availability=True),
+                             squash_courts=_court_count(SquashCourt))\
+            .annotate(capacity=models.Case(models.When(rooms_count=0, then=F('squash_courts')),
+                                           default=F('open_rooms'), output_field=models.IntegerField()))
 
 
 class SportCenter(models.Model):
@@ -26,6 +58,7 @@ class SportCenter(models.Model):
     phone_number = models.PositiveIntegerField()
     domain = models.URLField()
     slug = models.SlugField(blank=True, null=True)
+    objects = SportCenterQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -49,6 +82,36 @@ class SquashCourt(models.Model):
     room_number = models.IntegerField()
 
 
+class ReservationQuerySet(models.QuerySet):
+    def for_listing(self):
+        return self.select_related('location', 'user_main', 'user_partner', 'score')
+
+    def with_user(self, user):
+        return self.filter(models.Q(user_main=user) | models.Q(user_partner=user))
+
+    def open(self):
+        return self.filter(user_partner__isnull=True)
+
+    def joinable_by(self, user):
+        return self.open().filter(date__gte=datetime.date.today(),
+                                  user_main__skill=user.skill).exclude(user_main=user).order_by('date')
+
+    def search(self, user, date_start, date_end, location, skill):
+        return self.filter(date__gte=date_start,
+                           date__lte=date_end,
+                           location=location,
+                           user_main__skill=skill).exclude(models.Q(user_main=user) | models.Q(user_partner=user))
+
+    def hosted_by(self, user):
+        return self.filter(user_main=user, date__gt=datetime.date.today()).order_by('date')
+
+    def history_of(self, user):
+        return self.with_user(user).filter(date__lt=datetime.date.today()).order_by('date')
+
+    def upcoming_games_of(self, user):
+        return self.with_user(user).filter(user_partner__isnull=False, date__gt=datetime.date.today())
+
+
 class Reservation(models.Model):
     user_main = models.ForeignKey(MyUser, related_name='reservation')
     user_partner = models.ForeignKey(MyUser, related_name='user_partner', null=True)
@@ -57,6 +120,29 @@ class Reservation(models.Model):
     time_end = models.TimeField(auto_now=False, auto_now_add=False, verbose_name='Koniec rezerwacji')
     location = models.ForeignKey(SportCenter, verbose_name='Wybierz lokalizację')
     comment = models.CharField(max_length=256, null=True)
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'date'], name='reservation_location_date'),
+            models.Index(fields=['user_main', 'date'], name='reservation_main_date'),
+            models.Index(fields=['user_partner', 'date'], name='reservation_partner_date'),
+            models.Index(fields=['date'], name='reservation_date'),
+        ]
+
+    def join(self, user):
+        """Take the free seat for ``user`` and return whether they got it.
+
+        The seat is claimed with a single ``UPDATE ... WHERE user_partner_id IS NULL``, so of the players joining
+        at the same moment exactly one wins. Nobody can join their own room or a room that is already over.
+        """
+        joined = Reservation.objects.open().filter(pk=self.pk, date__gte=datetime.date.today())\
+            .exclude(user_main_id=user.pk).update(user_partner=user)
+        if not joined:
+            return False
+        self.user_partner = user
+        reservation_joined.send(sender=Reservation, reservation=self)
+        return True
 
 
 class Score(models.Model):
@@ -69,40 +155,281 @@ class Score(models.Model):
     def __str__(self):
         return "%s : %s" % (self.user_main_score, self.user_partner_score)
 
+    @property
+    def is_confirmed(self):
+        return self.is_confirmed_by_user_main and self.is_confirmed_by_user_partner
+
+    def confirm(self, user):
+        """Confirm the score on behalf of one of the players and update stats once both confirmed."""
+        with transaction.atomic():
+            score = Score.objects.select_for_update().select_related('room').get(pk=self.pk)
+            was_confirmed = score.is_confirmed
+            if user.id == score.room.user_main_id:
+                score.is_confirmed_by_user_main = True
+            elif user.id == score.room.user_partner_id:
+                score.is_confirmed_by_user_partner = True
+            else:
+                return False
+            score.save(update_fields=['is_confirmed_by_user_main', 'is_confirmed_by_user_partner'])
+            newly_confirmed = score.is_confirmed and not was_confirmed
+            if newly_confirmed:
+                UserStats.objects.add_score(score)
+        self.is_confirmed_by_user_main = score.is_confirmed_by_user_main
+        self.is_confirmed_by_user_partner = score.is_confirmed_by_user_partner
+        if newly_confirmed:
+            score_confirmed.send(sender=Score, score=score)
+        return True
+
+
+Replay = namedtuple('Replay', 'matches moved')
+
 
 class ScoreManager(models.Manager):
-    def add_winner_stats(self, user, score):
-        user.games_played += 1
-        user.games_won += 1
-        user.sets_won += 3
-        user.ranking += 1
-        return user.save()
+    def _add_stats(self, user_id, **deltas):
+        changes = {field: F(field) + value for field, value in deltas.items()}
+        changes['games_played'] = F('games_played') + 1
+        if not self.filter(user_id=user_id).update(**changes):
+            self.get_or_create(user_id=user_id)
+            self.filter(user_id=user_id).update(**changes)
+
+    def add_winner_stats(self, user_id, sets_won, sets_lost):
+        self._add_stats(user_id, games_won=1, sets_won=sets_won, sets_lost=sets_lost)
+
+    def add_looser_stats(self, user_id, sets_won, sets_lost):
+        self._add_stats(user_id, games_lost=1, sets_won=sets_won, sets_lost=sets_lost)
+
+    def add_score(self, score):
+        room = score.room
+        main_sets, partner_sets = score.user_main_score, score.user_partner_score
+        if main_sets > partner_sets:
+            self.add_winner_stats(room.user_main_id, main_sets, partner_sets)
+            self.add_looser_stats(room.user_partner_id, partner_sets, main_sets)
+        else:
+            self.add_winner_stats(room.user_partner_id, partner_sets, main_sets)
+            self.add_looser_stats(room.user_main_id, main_sets, partner_sets)
+        self.add_rating(score)
+
+    def add_rating(self, score):
+        """Rate one confirmed match and append it to both players' RatingHistory."""
+        room = score.room
+        if score.user_main_score + score.user_partner_score == 0:
+            return
+        # Locked in user_id order so two matches of the same players cannot deadlock.
+        players = {stats.user_id: stats for stats in self.select_for_update()
+                   .filter(user_id__in=[room.user_main_id, room.user_partner_id]).order_by('user_id')}
+        main, partner = players[room.user_main_id], players[room.user_partner_id]
+        new_ratings = ratings.rate(main.rating, partner.rating, score.user_main_score, score.user_partner_score)
+        history = []
+        for stats, rating in zip((main, partner), new_ratings):
+            history.append(RatingHistory(user_id=stats.user_id, score=score, date=room.date,
+                                         rating=rating, rating_change=rating - stats.rating))
+            stats.rating, stats.ranking = rating, int(round(rating))
+            stats.save(update_fields=['rating', 'ranking'])
+        RatingHistory.objects.bulk_create(history)
+
+    def _aggregate(self, user_ids=None):
+        """Stats of every player, or only of ``user_ids``, summed from confirmed scores in a single query."""
+        player_rows = """
+            SELECT r.{player}_id AS user_id,
+                   CASE WHEN {won} THEN 1 ELSE 0 END AS won,
+                   s.{player}_score AS sets_won,
+                   s.{opponent}_score AS sets_lost
+            FROM {score} s JOIN {reservation} r ON r.id = s.room_id
+            WHERE s.is_confirmed_by_user_main AND s.is_confirmed_by_user_partner{players}"""
+        tables = {'score': Score._meta.db_table, 'reservation': Reservation._meta.db_table}
+        players, params = '', []
+        if user_ids is not None:
+            players = ' AND r.{player}_id IN (%s)' % ', '.join(['%s'] * len(user_ids))
+            params = list(user_ids) * 2
+        sql = """
+            SELECT user_id, COUNT(*), SUM(won), SUM(sets_won), SUM(sets_lost)
+            FROM ({main} UNION ALL {partner}) AS results
+            GROUP BY user_id""".format(
+            main=player_rows.format(player='user_main', opponent='user_partner',
+                                    won='s.user_main_score > s.user_partner_score',
+                                    players=players.format(player='user_main'), **tables),
+            partner=player_rows.format(player='user_partner', opponent='user_main',
+                                       won='s.user_main_score <= s.user_partner_score',
+                                       players=players.format(player='user_partner'), **tables))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [self.model(user_id=user_id, games_played=played, games_won=won, games_lost=played - won,
+                           sets_won=sets_won, sets_lost=sets_lost)
+                for user_id, played, won, sets_won, sets_lost in rows]
+
+    def rebuild(self):
+        """Recompute every player's stats from confirmed scores in a single aggregate query."""
+        stats = self._aggregate()
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(stats)
+            self.replay_ratings()
+        return len(stats)
+
+    def rebuild_players(self, user_ids, since=None, batch_size=400):
+        """Recompute the counters of ``user_ids`` in batches and replay the ratings once; returns whose standing moved.
+
+        Ratings depend on every earlier match of both players, so the history is replayed from ``since``, the day
+        of the earliest changed match, or as a whole without it. The result holds ``user_ids`` and every player
+        whose ranking the replay moved.
+        """
+        user_ids = sorted(set(user_ids))
+        with transaction.atomic():
+            for start in range(0, len(user_ids), batch_size):
+                batch = user_ids[start:start + batch_size]
+                kept = {user_id: (rating, ranking) for user_id, rating, ranking in
+                        self.filter(user_id__in=batch).values_list('user_id', 'rating', 'ranking')}
+                self.filter(user_id__in=batch).delete()
+                stats = self._aggregate(batch)
+                for row in stats:
+                    # The replay only rewrites players it meets, everybody else keeps their rating.
+                    row.rating, row.ranking = kept.get(row.user_id, (row.rating, row.ranking))
+                self.bulk_create(stats)
+            replay = self.replay_ratings(since=since)
+        return set(user_ids) | replay.moved
+
+    def _insert_history(self, cursor, rows):
+        """Write ``(user_id, score_id, date, rating, rating_change)`` rows in bulk.
+
+        PostgreSQL streams them with COPY, other backends get multi-row INSERTs, never one statement per row.
+        """
+        if connection.vendor == 'postgresql':
+            data = io.StringIO(''.join('%s\t%s\t%s\t%r\t%r\n' % row for row in rows))
+            cursor.copy_expert('COPY %s (user_id, score_id, date, rating, rating_change) FROM STDIN'
+                               % RatingHistory._meta.db_table, data)
+            return
+        columns = ['user_id', 'score_id', 'date', 'rating', 'rating_change']
+        # As many rows per INSERT as the backend takes parameters, e.g. 999 on sqlite.
+        size = connection.ops.bulk_batch_size(columns, rows)
+        for start in range(0, len(rows), size):
+            batch = rows[start:start + size]
+            cursor.execute('INSERT INTO %s (%s) VALUES %s' % (
+                RatingHistory._meta.db_table, ', '.join(columns), ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))),
+                [value for row in batch for value in row])
+
+    def replay_ratings(self, since=None, batch_size=10000):
+        """Recompute ratings and RatingHistory from confirmed scores in chronological order.
 
-    def add_looser_stats(self, user, score):
-        user.games_played += 1
-        user.games_lost += 1
-        user.sets_lost += 3
-        return user.save()
+        With ``since`` only the matches from that day on are replayed, every player starting from the rating their
+        history reached before it. Returns the number of replayed matches and the players whose ranking moved.
+        """
+        matches = Score.objects.filter(is_confirmed_by_user_main=True, is_confirmed_by_user_partner=True)\
+            .exclude(user_main_score=0, user_partner_score=0)\
+            .order_by('room__date', 'room__time_start', 'id')\
+            .values_list('id', 'room__date', 'room__user_main_id', 'room__user_partner_id',
+                         'user_main_score', 'user_partner_score')
+        history = RatingHistory.objects.all()
+        if since is not None:
+            matches = matches.filter(room__date__gte=since)
+            history = history.filter(date__gte=since)
+
+        stats = 'UPDATE %s SET rating = %%s, ranking = %%s WHERE user_id = %%s' % self.model._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            # A raw cursor skips building a tuple per row through values_list, dates are written back as they came.
+            cursor.execute(*matches.query.sql_with_params())
+            rows = cursor.fetchall()
+            score_ids, dates, main_ids, partner_ids, main_sets, partner_sets = zip(*rows) if rows else ([],) * 6
+            user_ids, players = numpy.unique(numpy.array(main_ids + partner_ids, dtype=numpy.int64),
+                                             return_inverse=True)
+            initial = ratings.INITIAL_RATING
+            if since is not None:
+                # A rating is the initial one plus all its changes, so one SUM per player gives where they stood.
+                earlier = dict(RatingHistory.objects.filter(date__lt=since).values_list('user_id')
+                               .annotate(models.Sum('rating_change')).order_by())
+                initial = numpy.array([ratings.INITIAL_RATING + earlier.get(user_id, 0.0)
+                                       for user_id in user_ids.tolist()], dtype=numpy.float64)
+            final, main_after, partner_after, changes = ratings.replay(players[:len(rows)], players[len(rows):],
+                                                                       main_sets, partner_sets, len(user_ids),
+                                                                       initial=initial)
+            rankings = dict(self.values_list('user_id', 'ranking'))
+
+            history.delete()
+            for start in range(0, len(rows), batch_size):
+                batch = slice(start, start + batch_size)
+                self._insert_history(cursor, list(zip(main_ids[batch], score_ids[batch], dates[batch],
+                                                      main_after[batch].tolist(), changes[batch].tolist())) +
+                                     list(zip(partner_ids[batch], score_ids[batch], dates[batch],
+                                              partner_after[batch].tolist(), (-changes[batch]).tolist())))
+            new_rankings = {user_id: int(round(rating)) for user_id, rating in zip(user_ids.tolist(), final.tolist())}
+            if since is None:
+                # Players without a rated match go back to the start.
+                self.update(rating=ratings.INITIAL_RATING, ranking=int(ratings.INITIAL_RATING))
+                reset = {user_id: int(ratings.INITIAL_RATING) for user_id in rankings}
+                reset.update(new_rankings)
+                new_rankings = reset
+            cursor.executemany(stats, [(rating, new_rankings[user_id], user_id)
+                                       for user_id, rating in zip(user_ids.tolist(), final.tolist())])
+        moved = {user_id for user_id, ranking in new_rankings.items() if rankings.get(user_id) != ranking}
+        return Replay(len(rows), moved)
 
 
 class UserStats(models.Model):
-    user = models.ForeignKey(MyUser, related_name='stats')
+    user = models.OneToOneField(MyUser, related_name='stats')
     games_played = models.IntegerField(default=0)
     games_won = models.IntegerField(default=0)
     games_lost = models.IntegerField(default=0)
     sets_won = models.IntegerField(default=0)
     sets_lost = models.IntegerField(default=0)
-    ranking = models.IntegerField(default=0)
+    # Elo rating, ranking is the same number rounded for display and ordering.
+    rating = models.FloatField(default=ratings.INITIAL_RATING)
+    ranking = models.IntegerField(default=int(ratings.INITIAL_RATING))
     objects = ScoreManager()
 
 
+class RatingHistory(models.Model):
+    """A player's rating after each of their confirmed matches, for charting progress."""
+    user = models.ForeignKey(MyUser, related_name='rating_history')
+    score = models.ForeignKey(Score, related_name='rating_history')
+    date = models.DateField()
+    rating = models.FloatField()
+    rating_change = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='ratinghistory_user_date'),
+        ]
+
+
 class Messages(models.Model):
     user = models.ForeignKey(MyUser)
     content = models.CharField(max_length=256)
     date = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='messages_user_date'),
+        ]
 
     def __str__(self):
         return self.content
 
 
+class Notification(models.Model):
+    """Outbox row: written in the request, delivered as a Messages row (and e-mail) by a background worker."""
+    JOINED = 'joined'
+    SCORE_SUBMITTED = 'score_submitted'
+    SCORE_CONFIRMED = 'score_confirmed'
+    RESERVATION_CANCELLED = 'reservation_cancelled'
+    EVENTS = (
+        (JOINED, "Dołączenie do rezerwacji"),
+        (SCORE_SUBMITTED, "Wpisany wynik"),
+        (SCORE_CONFIRMED, "Potwierdzony wynik"),
+        (RESERVATION_CANCELLED, "Odwołana rezerwacja"),
+    )
 
+    user = models.ForeignKey(MyUser, related_name='notifications')
+    event = models.CharField(max_length=32, choices=EVENTS)
+    content = models.CharField(max_length=256)
+    send_email = models.BooleanField(default=True)
+    created = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='notification_pending'),
+        ]
+
+    def __str__(self):
+        return self.content
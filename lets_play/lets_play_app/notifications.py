@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import inbox
+from .models import Notification, Messages
+from .signals import score_confirmed, reservation_joined
+
+logger = logging.getLogger('lets_play.notifications')
+
+BATCH_SIZE = 500
+POLL_INTERVAL = getattr(settings, 'NOTIFICATION_POLL_INTERVAL', 30)
+EMAIL_SUBJECT = 'Squash League'
+
+_backends = {}
+
+
+def get_backend():
+    path = getattr(settings, 'NOTIFICATION_BACKEND', 'lets_play_app.notifications.OutboxBackend')
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def notify(event, user, content, email=True):
+    notify_many([Notification(user=user, event=event, content=content, send_email=email)])
+
+
+def notify_many(notifications):
+    if notifications:
+        get_backend().send(notifications)
+
+
+def deliver(notifications):
+    """Turn notifications into Messages rows and return the e-mails to send."""
+    Messages.objects.bulk_create([Messages(user_id=notification.user_id, content=notification.content)
+                                  for notification in notifications], batch_size=BATCH_SIZE)
+    user_ids = [notification.user_id for notification in notifications]
+    transaction.on_commit(lambda: inbox.messages_created(user_ids))
+    return [(EMAIL_SUBJECT, notification.content, settings.DEFAULT_FROM_EMAIL, [notification.user.email])
+            for notification in notifications if notification.send_email and notification.user.email]
+
+
+def send_emails(emails):
+    if emails:
+        try:
+            send_mass_mail(emails, fail_silently=False)
+        except Exception:
+            logger.exception('Sending %s notification e-mails failed.', len(emails))
+
+
+def process_outbox(batch_size=BATCH_SIZE):
+    """Deliver pending outbox rows in batches, returns the number of notifications delivered."""
+    delivered = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Notification.objects.select_for_update(skip_locked=True).select_related('user')
+                         .filter(processed_at=None).order_by('id')[:batch_size])
+            if not batch:
+                return delivered
+            emails = deliver(batch)
+            Notification.objects.filter(pk__in=[notification.pk for notification in batch])\
+                .update(processed_at=timezone.now())
+        send_emails(emails)
+        delivered += len(batch)
+
+
+class OutboxWorker(threading.Thread):
+    daemon = True
+
+    def __init__(self):
+        super(OutboxWorker, self).__init__(name='notification-outbox')
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                process_outbox()
+            except Exception:
+                logger.exception('Processing the notification outbox failed.')
+            finally:
+                connection.close()
+            self.wakeup.wait(POLL_INTERVAL)
+
+
+class OutboxBackend(object):
+    """Stores notifications in the outbox table and wakes an in-process worker once the transaction commits.
+
+    Rows left behind by a crashed process are picked up by the next worker or by ``manage.py process_outbox``.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def send(self, notifications):
+        Notification.objects.bulk_create(notifications)
+        transaction.on_commit(self.wake)
+
+    def wake(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = OutboxWorker()
+                self.worker.start()
+        self.worker.wakeup.set()
+
+
+class InMemoryBackend(object):
+    """Delivers synchronously and keeps every notification in ``outbox``, for tests."""
+
+    def __init__(self):
+        self.outbox = []
+
+    def send(self, notifications):
+        self.outbox.extend(notifications)
+        send_emails(deliver(notifications))
+
+
+@receiver(score_confirmed)
+def notify_score_confirmed(sender, score, **kwargs):
+    content = "Wynik meczu %s %s został potwierdzony" % (score.room.date, score)
+    notify_many([Notification(user_id=user_id, event=Notification.SCORE_CONFIRMED, content=content, send_email=False)
+                 for user_id in (score.room.user_main_id, score.room.user_partner_id)])
+
+
+@receiver(reservation_joined)
+def notify_reservation_joined(sender, reservation, **kwargs):
+    notify(Notification.JOINED, reservation.user_main, "%s dołączył do Twojej rezerwacji" % reservation.user_partner)
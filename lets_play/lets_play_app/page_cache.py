@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.template.loader import get_template
+
+from .models import SportCenter, Rooms, SquashCourt, Reservation
+from .signals import reservation_joined
+
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+SPORT_CENTRES = 'sport_centres'
+# Pages shown on the admin statistics page, the same name is used for the view and its fragment.
+TRACKED = ('sport_centres', 'sport_center_detail')
+
+_release = None
+
+
+def release():
+    """Identifies the deployed code, so markup cached by a previous deploy is never served.
+
+    ``CACHE_RELEASE`` (e.g. the commit hash) is used when set, otherwise a digest of the app's templates.
+    """
+    global _release
+    if _release is None:
+        _release = getattr(settings, 'CACHE_RELEASE', '') or _templates_digest()
+    return _release
+
+
+def _templates_digest():
+    digest = hashlib.md5()
+    directory = os.path.dirname(get_template('index.html').origin.name)
+    for root, dirs, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as template:
+                digest.update(template.read())
+    return digest.hexdigest()[:12]
+
+
+def sport_center_scope(slug):
+    return 'sport_center:%s' % slug
+
+
+def _generation_key(scope):
+    return 'pagecache:generation:%s' % scope
+
+
+def generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    for key in keys:
+        if key not in current:
+            # Time based so an evicted generation never brings back markup cached before it.
+            cache.add(key, int(time.time() * 1000), None)
+            current[key] = cache.get(key)
+    return [current[key] for key in keys]
+
+
+def make_key(name, scopes, *vary_on):
+    vary = hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    return 'pagecache:%s:%s:%s:%s' % (release(), name, '.'.join(str(g) for g in generations(scopes)), vary)
+
+
+def invalidate(*scopes):
+    for scope in set(scopes):
+        try:
+            cache.incr(_generation_key(scope))
+        except ValueError:
+            cache.set(_generation_key(scope), int(time.time() * 1000), None)
+
+
+def _stats_key(kind, name, outcome):
+    return 'pagecache:stats:%s:%s:%s' % (kind, name, outcome)
+
+
+def record(kind, name, hit):
+    key = _stats_key(kind, name, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    keys = [_stats_key(kind, name, outcome) for name in TRACKED for kind in ('view', 'fragment')
+            for outcome in ('hits', 'misses')]
+    counters = cache.get_many(keys)
+    rows = []
+    for name in TRACKED:
+        for kind in ('view', 'fragment'):
+            hits = counters.get(_stats_key(kind, name, 'hits'), 0)
+            misses = counters.get(_stats_key(kind, name, 'misses'), 0)
+            total = hits + misses
+            rows.append({'name': name, 'kind': kind, 'hits': hits, 'misses': misses,
+                         'hit_rate': 100.0 * hits / total if total else None})
+    return rows
+
+
+def reset_stats():
+    cache.delete_many([_stats_key(kind, name, outcome) for name in TRACKED for kind in ('view', 'fragment')
+                       for outcome in ('hits', 'misses')])
+
+
+class AnonymousPageCacheMixin(object):
+    """Caches whole GET responses for anonymous visitors, whose pages carry no per-user markup.
+
+    Logged in users get the fragment cache only, because the navigation bar is personal.
+    """
+    cache_name = None
+
+    def get_cache_scopes(self):
+        return [SPORT_CENTRES]
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        key = make_key(self.cache_name, self.get_cache_scopes(), request.get_full_path())
+        response = cache.get(key)
+        record('view', self.cache_name, response is not None)
+        if response is not None:
+            return response
+
+        response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(lambda rendered: cache.set(key, rendered, TIMEOUT))
+            else:
+                cache.set(key, response, TIMEOUT)
+        return response
+
+
+@receiver(post_save, sender=SportCenter)
+@receiver(post_delete, sender=SportCenter)
+def invalidate_sport_centres(sender, instance, **kwargs):
+    # The list shows every centre and a renamed slug moves a detail page, so everything goes.
+    invalidate(SPORT_CENTRES)
+
+
+@receiver(post_save, sender=Rooms)
+@receiver(post_delete, sender=Rooms)
+@receiver(post_save, sender=SquashCourt)
+@receiver(post_delete, sender=SquashCourt)
+def invalidate_courts(sender, instance, **kwargs):
+    slug = SportCenter.objects.filter(pk=instance.sport_center_id).values_list('slug', flat=True).first()
+    invalidate(sport_center_scope(slug))
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_week_grid(sender, instance, **kwargs):
+    slug = SportCenter.objects.filter(pk=instance.location_id).values_list('slug', flat=True).first()
+    invalidate(sport_center_scope(slug))
+
+
+@receiver(reservation_joined)
+def invalidate_joined_room(sender, reservation, **kwargs):
+    invalidate_week_grid(sender, reservation)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+from collections import namedtuple
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+KeysetPage = namedtuple('KeysetPage', 'object_list previous_cursor next_cursor')
+# Below this many rows an exact COUNT(*) is cheap enough and nobody has to wonder about a rounded total.
+ESTIMATE_THRESHOLD = 10000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator(object):
+    """Seek-method pagination: pages are selected with WHERE (key) > (cursor), never with OFFSET.
+
+    ``ordering`` lists the key fields, e.g. ('date', 'id') or ('-date', '-id'); the last one must be unique.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.descending = ordering[0].startswith('-')
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for name in self.fields:
+            # Rows of a .values() queryset are dicts.
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            model_fields = [self.queryset.model._meta.get_field(name) for name in self.fields]
+            return [field.to_python(value) for field, value in zip(model_fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _seek(self, values, forward):
+        lookup = 'lt' if forward == self.descending else 'gt'
+        connection = connections[self.queryset.db]
+        if connection.vendor == 'postgresql' and len({name.startswith('-') for name in self.ordering}) == 1:
+            # A row value comparison is one index range scan, so a deep page costs what the first one does.
+            opts = self.queryset.model._meta
+            fields = [opts.get_field(name) for name in self.fields]
+            columns = ['%s.%s' % (connection.ops.quote_name(opts.db_table), connection.ops.quote_name(field.column))
+                       for field in fields]
+            return self.queryset.extra(
+                where=['(%s) %s (%s)' % (', '.join(columns), '<' if lookup == 'lt' else '>',
+                                         ', '.join(['%s'] * len(columns)))],
+                params=[field.get_db_prep_value(value, connection) for field, value in zip(fields, values)])
+        # Other backends, and mixed directions, get the equivalent OR of ANDs.
+        condition = Q()
+        for position in reversed(range(len(self.fields))):
+            exact = {name: value for name, value in zip(self.fields[:position], values[:position])}
+            exact['%s__%s' % (self.fields[position], lookup)] = values[position]
+            condition |= Q(**exact)
+        return self.queryset.filter(condition)
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else '-' + name for name in self.ordering]
+
+    def page(self, after=None, before=None):
+        if before:
+            rows = list(self._seek(self.decode_cursor(before), forward=False)
+                        .order_by(*self._reversed_ordering())[:self.per_page + 1])
+            has_previous, has_next = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+        else:
+            queryset = self._seek(self.decode_cursor(after), forward=True) if after else self.queryset
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_previous, has_next = bool(after), len(rows) > self.per_page
+            rows = rows[:self.per_page]
+
+        previous_cursor = self.encode_cursor(rows[0]) if rows and has_previous else None
+        next_cursor = self.encode_cursor(rows[-1]) if rows and has_next else None
+        return KeysetPage(rows, previous_cursor, next_cursor)
+
+    def page_from_request(self, request):
+        try:
+            return self.page(after=request.GET.get('after'), before=request.GET.get('before'))
+        except InvalidCursor:
+            return self.page()
+
+
+def estimated_count(queryset):
+    """The PostgreSQL planner's row estimate of an unfiltered queryset's table, or None where there is none."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where or queryset.query.distinct:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Page numbers from the table statistics instead of a full COUNT(*) for unfiltered lists of big tables.
+
+    The admin changelist counts its rows on every page; on a table of millions that scan is most of the page.
+    Filtered lists and small tables are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list) if hasattr(self.object_list, 'query') else None
+        if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent once a score has been confirmed by both players and UserStats were updated.
+score_confirmed = Signal(providing_args=['score'])
+
+# Sent after a player took the free seat of a reservation. The seat is taken with a conditional UPDATE, which
+# bypasses post_save, so receivers of Reservation changes that care about joins listen here as well.
+reservation_joined = Signal(providing_args=['reservation'])
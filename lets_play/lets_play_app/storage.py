@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.html', '.xml')
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed file names plus precompressed ``.gz`` (and ``.br`` when brotli is installed) variants."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        for original_path, processed_path, processed in super(CompressedManifestStaticFilesStorage, self)\
+                .post_process(paths, dry_run, **options):
+            if not dry_run and isinstance(processed_path, str) and processed_path.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(processed_path)
+            yield original_path, processed_path, processed
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        variants = [('.gz', gzip.compress(content, compresslevel=9))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for extension, compressed in variants:
+            # Only worth storing when the server would actually send fewer bytes.
+            if len(compressed) < len(content):
+                with open(path + extension, 'wb') as output:
+                    output.write(compressed)
+            elif os.path.exists(path + extension):
+                os.remove(path + extension)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django import template
+from django.core.cache import cache
+
+from lets_play_app import page_cache
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, scopes, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.scopes = scopes
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        key = page_cache.make_key('fragment:%s' % name, self.scopes.resolve(context),
+                                  *[variable.resolve(context) for variable in self.vary_on])
+        content = cache.get(key)
+        page_cache.record('fragment', name, content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, page_cache.TIMEOUT)
+        return content
+
+
+@register.tag('cachefragment')
+def do_cachefragment(parser, token):
+    """
+    Like ``{% cache %}``, but keyed by the deploy and the generations of the given invalidation scopes::
+
+        {% cachefragment "sport_center_detail" cache_scopes today %} ... {% endcachefragment %}
+    """
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError("%r tag requires a name and the cache scopes." % bits[0])
+    return CacheFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]),
+                             [parser.compile_filter(bit) for bit in bits[3:]])
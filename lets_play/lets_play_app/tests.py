@@ -1,3 +1,1367 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy
+from PIL import Image
+
+from . import analytics, availability, bulk_scores, housekeeping, ical, inbox, leaderboard, league_dump, matchmaking,\
+    notifications, page_cache, ratings, utilization
+from .availability import book_court, week_grid, CourtUnavailable
+from .db import check_connections
+from .models import MyUser, SportCenter, Rooms, SquashCourt, Reservation, Score, UserStats, Messages, Notification,\
+    RatingHistory
+from .pagination import KeysetPaginator, EstimatedCountPaginator
+from .wsgi_static import StaticFilesMiddleware, HASHED_NAME
+
+
+def create_sport_center(name='Squash Arena'):
+    return SportCenter.objects.create(name=name, address='Warszawska 1', phone_number=123456789,
+                                      domain='http://example.com', slug=name.lower().replace(' ', '-'))
+
+
+class ReservationListingQueriesTest(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+        self.sport_center = create_sport_center()
+
+    def create_rooms(self, count, days):
+        today = datetime.date.today()
+        offset = MyUser.objects.count()
+        for i in range(count):
+            partner = MyUser.objects.create_user(username='partner%s' % (offset + i), password='secret123', skill=2)
+            room = Reservation.objects.create(user_main=self.user, user_partner=partner,
+                                              date=today + datetime.timedelta(days=days),
+                                              time_start='18:00', time_end='19:00',
+                                              location=self.sport_center)
+            if days < 0:
+                Score.objects.create(room=room, user_main_score=3, user_partner_score=i % 3)
+
+    def create_open_rooms(self, count):
+        owner = MyUser.objects.create_user(username='owner%s' % count, password='secret123', skill=2)
+        for i in range(count):
+            Reservation.objects.create(user_main=owner, date=datetime.date.today() + datetime.timedelta(days=1),
+                                       time_start='18:00', time_end='19:00', location=self.sport_center)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, add_rows):
+        add_rows(2)
+        few = self.count_queries(url)
+        add_rows(10)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_user_history_queries(self):
+        self.assertConstantQueries(reverse('user_history'), lambda count: self.create_rooms(count, -3))
+
+    def test_user_games_queries(self):
+        self.assertConstantQueries(reverse('user_games'), lambda count: self.create_rooms(count, 3))
+
+    def test_user_reservations_queries(self):
+        self.assertConstantQueries(reverse('user_reservations'), lambda count: self.create_rooms(count, 3))
+
+    def test_join_room_queries(self):
+        self.assertConstantQueries(reverse('reservations_list'), self.create_open_rooms)
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        self.sport_center = create_sport_center()
+        self.players = [MyUser.objects.create_user(username='player%s' % i, password='secret123', skill=2)
+                        for i in range(3)]
+
+    def play(self, user_main, user_partner, main_score, partner_score):
+        room = Reservation.objects.create(user_main=user_main, user_partner=user_partner,
+                                          date=datetime.date.today() - datetime.timedelta(days=1),
+                                          time_start='18:00', time_end='19:00', location=self.sport_center)
+        return Score.objects.create(room=room, user_main_score=main_score, user_partner_score=partner_score)
+
+    def stats_snapshot(self):
+        return sorted(UserStats.objects.values_list('user_id', 'games_played', 'games_won', 'games_lost',
+                                                    'sets_won', 'sets_lost', 'ranking'))
+
+    def test_stats_updated_only_when_both_players_confirm(self):
+        first, second = self.players[:2]
+        score = self.play(first, second, 3, 1)
+        score.confirm(first)
+        self.assertFalse(UserStats.objects.exists())
+        score.confirm(second)
+        score.confirm(second)
+        winner = UserStats.objects.get(user=first)
+        looser = UserStats.objects.get(user=second)
+        self.assertEqual((winner.games_played, winner.games_won, winner.sets_won, winner.sets_lost), (1, 1, 3, 1))
+        self.assertEqual((looser.games_played, looser.games_lost, looser.sets_won, looser.sets_lost), (1, 1, 1, 3))
+
+    def test_outsider_cannot_confirm(self):
+        score = self.play(self.players[0], self.players[1], 3, 0)
+        self.assertFalse(score.confirm(self.players[2]))
+
+    def test_rebuild_matches_incremental_updates(self):
+        first, second, third = self.players
+        results = [(first, second, 3, 2), (second, third, 1, 3), (third, first, 3, 0), (first, third, 2, 3)]
+        for user_main, user_partner, main_score, partner_score in results:
+            score = self.play(user_main, user_partner, main_score, partner_score)
+            score.confirm(user_main)
+            score.confirm(user_partner)
+        self.play(first, second, 3, 0).confirm(first)
+        incremental = self.stats_snapshot()
+        history = sorted(RatingHistory.objects.values_list('user_id', 'score_id', 'rating'))
+        self.assertEqual(UserStats.objects.rebuild(), 3)
+        self.assertEqual(self.stats_snapshot(), incremental)
+        rebuilt = sorted(RatingHistory.objects.values_list('user_id', 'score_id', 'rating'))
+        self.assertEqual([row[:2] for row in rebuilt], [row[:2] for row in history])
+        for (user_id, score_id, rating), (_, _, replayed) in zip(history, rebuilt):
+            self.assertAlmostEqual(rating, replayed)
+
+    def test_set_margin_moves_ratings(self):
+        first, second, third = self.players
+        for user_partner, partner_score in ((second, 0), (third, 2)):
+            score = self.play(first, user_partner, 3, partner_score)
+            score.confirm(first)
+            score.confirm(user_partner)
+        second_stats, third_stats = UserStats.objects.get(user=second), UserStats.objects.get(user=third)
+        self.assertLess(second_stats.rating, third_stats.rating)
+        self.assertLess(third_stats.rating, ratings.INITIAL_RATING)
+        self.assertEqual(UserStats.objects.get(user=first).ranking,
+                         round(3 * ratings.INITIAL_RATING - second_stats.rating - third_stats.rating))
+
+        response = self.client.get(reverse('profile', args=[first.pk]))
+        self.assertEqual(response.context['rating_chart'].count(','), 2)
+
+
+class RatingReplayTest(TestCase):
+    def test_vectorized_replay_matches_sequential_ratings(self):
+        rng = numpy.random.RandomState(7)
+        matches = 500
+        main_players = rng.randint(0, 20, matches)
+        partner_players = (main_players + rng.randint(1, 20, matches)) % 20
+        main_sets = rng.randint(0, 4, matches)
+        partner_sets = numpy.where(main_sets == 3, rng.randint(0, 3, matches), 3)
+
+        final, main_after, partner_after, changes = ratings.replay(main_players, partner_players,
+                                                                   main_sets, partner_sets, 20)
+
+        expected = [ratings.INITIAL_RATING] * 20
+        for i in range(matches):
+            main, partner = main_players[i], partner_players[i]
+            expected[main], expected[partner] = ratings.rate(expected[main], expected[partner],
+                                                             main_sets[i], partner_sets[i])
+            self.assertAlmostEqual(main_after[i], expected[main])
+            self.assertAlmostEqual(partner_after[i], expected[partner])
+        numpy.testing.assert_allclose(final, expected)
+        self.assertAlmostEqual(final.sum(), 20 * ratings.INITIAL_RATING)
+
+    def test_replay_runs_on_the_pinned_numpy(self):
+        # requirements.txt pins numpy 1.14.2, whose argsort knows no kind='stable'.
+        argsort = numpy.argsort
+
+        def pinned_argsort(a, axis=-1, kind='quicksort', order=None):
+            if kind not in ('quicksort', 'mergesort', 'heapsort'):
+                raise ValueError('%s is an unrecognized kind of sort' % kind)
+            return argsort(a, axis=axis, kind=kind, order=order)
+
+        with mock.patch.object(ratings.np, 'argsort', pinned_argsort):
+            final, main_after, partner_after, changes = ratings.replay([0, 1, 0], [1, 2, 2], [3, 3, 1], [0, 2, 3], 3)
+        self.assertAlmostEqual(final.sum(), 3 * ratings.INITIAL_RATING)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.padawans = [MyUser.objects.create_user(username='padawan%s' % i, password='secret123', skill=2)
+                         for i in range(3)]
+        self.master = MyUser.objects.create_user(username='master', password='secret123', skill=4)
+
+    def confirm_win(self, winner, looser):
+        room = Reservation.objects.create(user_main=winner, user_partner=looser,
+                                          date=datetime.date.today() - datetime.timedelta(days=1),
+                                          time_start='18:00', time_end='19:00', location=self.sport_center)
+        score = Score.objects.create(room=room, user_main_score=3, user_partner_score=1)
+        score.confirm(winner)
+        score.confirm(looser)
+
+    def test_tier_ranking(self):
+        self.confirm_win(self.padawans[2], self.padawans[0])
+        page = leaderboard.get_page(2)
+        self.assertEqual([standing.username for standing in page.standings], ['padawan2', 'padawan1', 'padawan0'])
+        self.assertEqual([standing.rank for standing in page.standings], [1, 2, 3])
+        self.assertEqual(page.count, 3)
+
+    def test_snapshot_is_served_from_cache(self):
+        leaderboard.get_page(2)
+        with self.assertNumQueries(0):
+            leaderboard.get_page(2)
+
+    def test_confirmed_score_invalidates_only_affected_tier(self):
+        leaderboard.get_page(2)
+        leaderboard.get_page(4)
+        self.confirm_win(self.padawans[1], self.padawans[0])
+        with self.assertNumQueries(0):
+            leaderboard.get_page(4)
+        self.assertEqual(leaderboard.get_page(2).standings[0].username, 'padawan1')
+
+    def test_stale_snapshot_is_served_while_another_request_rebuilds(self):
+        leaderboard.get_page(2)
+        self.confirm_win(self.padawans[1], self.padawans[0])
+        # Another request holds the rebuild lock of the new version.
+        cache.add(leaderboard._rebuild_key(2, leaderboard.version(2)), True)
+        with self.assertNumQueries(0):
+            page = leaderboard.get_page(2)
+        self.assertEqual(page.standings[0].username, 'padawan0')
+
+        cache.delete(leaderboard._rebuild_key(2, leaderboard.version(2)))
+        self.assertEqual(leaderboard.get_page(2).standings[0].username, 'padawan1')
+
+    def test_view(self):
+        response = self.client.get(reverse('leaderboard_tier', args=[2]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'padawan0')
+        self.assertNotContains(response, 'master')
+
+
+class AvailabilityTest(TestCase):
+    def setUp(self):
+        self.sport_center = create_sport_center()
+        for number in range(2):
+            Rooms.objects.create(room_number=number, sport_center=self.sport_center)
+        Rooms.objects.create(room_number=2, sport_center=self.sport_center, availability=False)
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+
+    def book(self, start, end):
+        return book_court(self.user, self.sport_center, self.date, datetime.time(start), datetime.time(end))
+
+    def test_occupancy_sweep(self):
+        self.assertEqual(availability.occupancy([(600, 720), (660, 780), (720, 780)]),
+                         [(600, 660, 1), (660, 720, 2), (720, 780, 2)])
+
+    def test_capacity_is_enforced(self):
+        self.book(18, 20)
+        self.book(19, 21)
+        with self.assertRaises(CourtUnavailable):
+            self.book(19, 20)
+        self.book(20, 21)
+        with self.assertRaises(CourtUnavailable):
+            self.book(18, 22)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+    def test_centre_without_rooms_counts_its_squash_courts(self):
+        self.sport_center = create_sport_center('Courts Only')
+        SquashCourt.objects.create(sport_center=self.sport_center, room_number=1)
+        self.book(18, 19)
+        with self.assertRaises(CourtUnavailable):
+            self.book(18, 19)
+        self.assertEqual(SportCenter.objects.with_capacity().get(pk=self.sport_center.pk).capacity, 1)
+        self.assertEqual(SportCenter.objects.with_capacity().get(name='Squash Arena').capacity, 2)
+
+    def test_week_grid(self):
+        self.book(18, 20)
+        self.book(19, 20)
+        with self.assertNumQueries(2):
+            grid = week_grid(self.sport_center, self.date)
+        self.assertEqual(len(grid), 7)
+        free = {slot.time_start.hour: slot.free for slot in grid[self.date]}
+        self.assertEqual((free[17], free[18], free[19], free[20]), (2, 1, 0, 2))
+        self.assertTrue(all(slot.free == 2 for slot in grid[self.date + datetime.timedelta(days=1)]))
+
+    def test_create_reservation_view_reports_full_centre(self):
+        self.book(18, 19)
+        self.book(18, 19)
+        self.client.login(username='player', password='secret123')
+        response = self.client.post(reverse('create_reservation'), {'location': self.sport_center.pk,
+                                                                    'date': self.date.isoformat(),
+                                                                    'time_start': 18, 'time_end': 19})
+        self.assertContains(response, 'Brak wolnych kortów')
+
+    def test_sport_center_week_grid_page(self):
+        self.book(18, 20)
+        response = self.client.get(reverse('sp_detail', args=[self.sport_center.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['week']()), 7)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        for i in range(25):
+            Messages.objects.create(user=self.user, content='message %s' % i)
+        sport_center = create_sport_center()
+        for i in range(7):
+            Reservation.objects.create(user_main=self.user, date=datetime.date(2018, 3, 1 + i // 2),
+                                       time_start='18:00', time_end='19:00', location=sport_center)
+
+    def test_walks_forward_and_back(self):
+        paginator = KeysetPaginator(Reservation.objects.all(), ('date', 'id'), per_page=3)
+        expected = list(Reservation.objects.order_by('date', 'id'))
+        first = paginator.page()
+        second = paginator.page(after=first.next_cursor)
+        third = paginator.page(after=second.next_cursor)
+        self.assertEqual(first.object_list + second.object_list + third.object_list, expected)
+        self.assertIsNone(first.previous_cursor)
+        self.assertIsNone(third.next_cursor)
+        self.assertEqual(paginator.page(before=third.previous_cursor).object_list, second.object_list)
+        self.assertEqual(paginator.page(before=second.previous_cursor), first)
+
+    def test_postgresql_seeks_with_a_row_value(self):
+        paginator = KeysetPaginator(Reservation.objects.all(), ('date', 'id'), per_page=3)
+        cursor = paginator.page().next_cursor
+        expected = paginator.page(after=cursor)
+        # sqlite understands row values too, so the PostgreSQL query can run here.
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            seek = paginator._seek(paginator.decode_cursor(cursor), forward=True)
+            page = paginator.page(after=cursor)
+        self.assertIn('("lets_play_app_reservation"."date", "lets_play_app_reservation"."id") > (', str(seek.query))
+        self.assertNotIn(' OR ', str(seek.query))
+        self.assertEqual(page, expected)
+
+    def test_descending_messages_view(self):
+        self.client.login(username='player', password='secret123')
+        response = self.client.get(reverse('messages'))
+        first = response.context['messages']
+        self.assertEqual(len(first), 20)
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(reverse('messages'))
+        with CaptureQueriesContext(connection) as second_page:
+            response = self.client.get(reverse('messages'), {'after': response.context['page'].next_cursor})
+        self.assertEqual(len(first_page), len(second_page))
+        second = response.context['messages']
+        self.assertEqual([message.content for message in first + second],
+                         ['message %s' % i for i in reversed(range(25))])
+        self.assertIsNone(response.context['page'].next_cursor)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.client.login(username='player', password='secret123')
+        response = self.client.get(reverse('messages'), {'after': 'garbage'})
+        self.assertEqual(len(response.context['messages']), 20)
+
+
+class DataGenerationAndBenchmarkTest(TestCase):
+    def test_generate_data_and_benchmark_report(self):
+        call_command('generate_data', users=20, centres=2, reservations=200, messages=50, seed=1, stdout=StringIO())
+        self.assertEqual(MyUser.objects.count(), 20)
+        self.assertEqual(Reservation.objects.count(), 200)
+        self.assertTrue(Score.objects.exists())
+        self.assertTrue(UserStats.objects.exists())
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_views', repeat=1, output=output.name, stdout=StringIO())
+            report = json.load(open(output.name))
+        self.assertIn('user_history', report['views'])
+        self.assertEqual(report['views']['user_history']['status'], 200)
+        self.assertNotIn('delete_room', report['views'])
+
+
+class RequestMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+
+    def test_server_timing_header_and_log_line(self):
+        with self.assertLogs('lets_play.requests', level='INFO') as logs:
+            response = self.client.get(reverse('user_history'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('view;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'user_history')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(record['template_ms'], record['view_ms'])
+        self.assertLessEqual(record['view_ms'], record['total_ms'])
+        self.assertFalse(record['streamed'])
+
+    def test_streamed_response_is_logged_with_its_queries(self):
+        url = reverse('calendar_feed', args=[ical.feed_token(self.user)])
+        with self.assertLogs('lets_play.requests', level='INFO') as logs:
+            response = self.client.get(url)
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['streamed'])
+        # The header went out before the feed queried its games, the log line came after.
+        before_stream = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(record['db_queries'], before_stream)
+        self.assertEqual(record['template_ms'], 0)
+
+    def test_requests_without_queries_are_not_captured(self):
+        with self.assertLogs('lets_play.requests', level='INFO') as logs:
+            self.client.get('/no-such-page/')
+        self.assertEqual(json.loads(logs.records[0].getMessage())['db_queries'], 0)
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertNotIn('make_cursor', vars(connection))
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_instrumented(self):
+        response = self.client.get(reverse('user_history'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class NotificationTest(TestCase):
+    def setUp(self):
+        self.sport_center = create_sport_center()
+        self.host = MyUser.objects.create_user(username='host', email='host@example.com', password='secret123', skill=2)
+        self.guest = MyUser.objects.create_user(username='guest', password='secret123', skill=2)
+        self.room = Reservation.objects.create(user_main=self.host, date=datetime.date.today() + datetime.timedelta(days=1),
+                                               time_start='18:00', time_end='19:00', location=self.sport_center)
+
+    def test_join_goes_through_outbox(self):
+        self.client.login(username='guest', password='secret123')
+        self.client.post(reverse('room', args=[self.room.pk]))
+        self.assertEqual(Notification.objects.filter(user=self.host, event=Notification.JOINED).count(), 1)
+        self.assertFalse(Messages.objects.exists())
+
+        self.assertEqual(notifications.process_outbox(), 1)
+        self.assertEqual(Messages.objects.get().user, self.host)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['host@example.com'])
+        self.assertFalse(Notification.objects.filter(processed_at=None).exists())
+        self.assertEqual(notifications.process_outbox(), 0)
+
+    @override_settings(NOTIFICATION_BACKEND='lets_play_app.notifications.InMemoryBackend')
+    def test_in_memory_backend(self):
+        backend = notifications.get_backend()
+        backend.outbox = []
+        self.room.user_partner = self.guest
+        self.room.save()
+        score = Score.objects.create(room=self.room, user_main_score=3, user_partner_score=2)
+        score.confirm(self.host)
+        score.confirm(self.guest)
+        self.assertEqual([notification.event for notification in backend.outbox], [Notification.SCORE_CONFIRMED] * 2)
+        self.assertEqual(Messages.objects.count(), 2)
+        self.assertFalse(Notification.objects.exists())
+
+
+class UnreadMessagesTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+
+    @override_settings(NOTIFICATION_BACKEND='lets_play_app.notifications.InMemoryBackend')
+    def test_counter_follows_created_and_read_messages(self):
+        self.assertEqual(inbox.unread_count(self.user.pk), 0)
+        notifications.notify(Notification.JOINED, self.user, 'first')
+        notifications.notify(Notification.JOINED, self.user, 'second')
+        with self.assertNumQueries(0):
+            self.assertEqual(inbox.unread_count(self.user.pk), 2)
+
+        response = self.client.get(reverse('messages'))
+        self.assertEqual(response.context['unread_messages'], 0)
+        self.assertFalse(Messages.objects.filter(is_read=False).exists())
+        self.assertEqual(inbox.unread_count(self.user.pk), 0)
+
+    def test_only_the_displayed_page_is_marked_read(self):
+        messages = [Messages.objects.create(user=self.user, content='message %s' % i) for i in range(25)]
+        inbox.reconcile()
+        response = self.client.get(reverse('messages'))
+        self.assertEqual(response.context['unread_messages'], 5)
+        self.assertEqual(set(Messages.objects.filter(is_read=False).values_list('pk', flat=True)),
+                         {message.pk for message in messages[:5]})
+
+        self.client.get(reverse('messages'), {'after': response.context['page'].next_cursor})
+        self.assertFalse(Messages.objects.filter(is_read=False).exists())
+        self.assertEqual(inbox.unread_count(self.user.pk), 0)
+
+    def test_badge_served_from_cache(self):
+        Messages.objects.create(user=self.user, content='hello')
+        inbox.reconcile()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        self.assertContains(response, '<span class="badge badge-light">1</span>', html=True)
+        self.assertFalse([query for query in queries.captured_queries if 'lets_play_app_messages' in query['sql']])
+
+
+def image_upload(name='avatar.png', size=(600, 400), color=(200, 30, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class AvatarTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+
+    def upload(self, upload):
+        return self.client.post(reverse('edit_profile'), {'first_name': 'Jan', 'last_name': 'Kowalski',
+                                                         'email': 'jan@example.com', 'skill': 2, 'avatar': upload})
+
+    def test_upload_is_normalized_and_deduplicated(self):
+        self.upload(image_upload('first.png'))
+        other = MyUser.objects.create_user(username='other', password='secret123', skill=2)
+        self.client.login(username='other', password='secret123')
+        self.upload(image_upload('second.png'))
+
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, other.avatar.name)
+        self.assertTrue(self.user.avatar.name.endswith('.jpg'))
+        stored = Image.open(self.user.avatar.path)
+        self.assertEqual((stored.format, max(stored.size)), ('JPEG', 512))
+        self.assertEqual(len(os.listdir(os.path.dirname(self.user.avatar.path))), 1)
+
+    def test_oversized_image_rejected(self):
+        with mock.patch('lets_play_app.avatars.MAX_PIXELS', 100 * 100):
+            response = self.upload(image_upload(size=(101, 100)))
+        self.assertIn('rozdzielczo', response.content.decode())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_thumbnail_generated_lazily(self):
+        self.upload(image_upload())
+        self.user.refresh_from_db()
+        thumbnail = os.path.join(self.media_root, 'avatars', 'thumbs', '150', self.user.avatar.name + '.jpg')
+        self.assertFalse(os.path.exists(thumbnail))
+
+        response = self.client.get(self.user.avatar_thumbnail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(thumbnail))
+        self.assertEqual(Image.open(thumbnail).size, (150, 150))
+        self.assertContains(self.client.get(reverse('profile', args=[self.user.pk])), self.user.avatar_thumbnail_url)
+
+    def test_thumbnail_rejects_unknown_size_and_paths(self):
+        self.assertEqual(self.client.get(reverse('avatar_thumbnail', args=[999, 'x.jpg'])).status_code, 404)
+        self.assertEqual(self.client.get('/avatars/150/../../settings.py').status_code, 404)
+
+
+class StaticAssetsTest(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        with override_settings(STATIC_ROOT=self.static_root,
+                               STATICFILES_STORAGE='lets_play_app.storage.CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as manifest:
+            self.css = json.load(manifest)['paths']['css/simple-sidebar.css']
+        self.application = StaticFilesMiddleware(None, [('/static/', self.static_root, HASHED_NAME)])
+
+    def get(self, path, **headers):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'wsgi.file_wrapper': lambda f, size: iter(f.read, b'')}
+        environ.update(('HTTP_%s' % key.upper(), value) for key, value in headers.items())
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(response_headers)
+
+        body = b''.join(self.application(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertRegex(self.css, r'^css/simple-sidebar\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.static_root, self.css)
+        with open(path, 'rb') as original, gzip.open(path + '.gz') as compressed:
+            self.assertEqual(original.read(), compressed.read())
+
+    def test_hashed_file_is_immutable_and_gzipped(self):
+        status, headers, body = self.get('/static/' + self.css, accept_encoding='gzip, deflate')
+        self.assertEqual(status, 200)
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual((headers['Content-Encoding'], headers['Vary']), ('gzip', 'Accept-Encoding'))
+        self.assertIn(b'sidebar-wrapper', gzip.decompress(body))
+
+        status, headers, body = self.get('/static/css/simple-sidebar.css')
+        self.assertEqual(status, 200)
+        self.assertNotIn('immutable', headers['Cache-Control'])
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_conditional_and_range_requests(self):
+        status, headers, body = self.get('/static/' + self.css)
+        self.assertEqual(self.get('/static/' + self.css, if_none_match=headers['ETag'])[0], 304)
+
+        status, headers, partial = self.get('/static/' + self.css, range='bytes=10-19', accept_encoding='gzip')
+        self.assertEqual((status, partial), (206, body[10:20]))
+        self.assertEqual(headers['Content-Range'], 'bytes 10-19/%s' % len(body))
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(self.get('/static/' + self.css, range='bytes=-5')[2], body[-5:])
+        self.assertEqual(self.get('/static/' + self.css, range='bytes=%s-' % len(body))[0], 416)
+
+        status, headers, whole = self.get('/static/' + self.css, range='bytes=0-1,5-6')
+        self.assertEqual((status, whole), (200, body))
+        self.assertNotIn('Content-Range', headers)
+
+    def test_every_encoding_has_its_own_etag(self):
+        etags = {self.get('/static/' + self.css, accept_encoding=encoding)[1]['ETag'] for encoding in ('', 'gzip')}
+        self.assertEqual(len(etags), 2)
+        gzip_etag = [etag for etag in etags if etag.endswith('-gzip"')][0]
+        self.assertEqual(self.get('/static/' + self.css, accept_encoding='gzip', if_none_match=gzip_etag)[0], 304)
+        self.assertEqual(self.get('/static/' + self.css, if_none_match=gzip_etag)[0], 200)
+
+    def test_paths_outside_root_not_served(self):
+        self.assertEqual(self.get('/static/../settings.py')[0], 404)
+        self.assertEqual(self.get('/static/css')[0], 404)
+
+    def test_measure_assets(self):
+        output = StringIO()
+        call_command('measure_assets', '/', stdout=output)
+        production = [line for line in output.getvalue().splitlines() if 'production' in line][0]
+        self.assertIn('0 req          0 B', production)
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        Rooms.objects.create(room_number=1, sport_center=self.sport_center)
+        self.detail_url = reverse('sp_detail', args=[self.sport_center.slug])
+
+    def stats(self, name, kind):
+        return [(row['hits'], row['misses']) for row in page_cache.stats()
+                if row['name'] == name and row['kind'] == kind][0]
+
+    def test_anonymous_list_served_from_cache_until_centre_changes(self):
+        self.client.get('/sport_centres/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/sport_centres/')
+        self.assertContains(response, 'Squash Arena')
+        self.assertEqual(self.stats('sport_centres', 'view'), (1, 1))
+
+        self.sport_center.name = 'Squash Park'
+        self.sport_center.save()
+        self.assertContains(self.client.get('/sport_centres/'), 'Squash Park')
+
+    def test_logged_in_detail_uses_fragment_invalidated_by_courts(self):
+        MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+        first = self.client.get(self.detail_url).content
+        with CaptureQueriesContext(connection) as cached:
+            second = self.client.get(self.detail_url).content
+        self.assertEqual(first, second)
+        self.assertFalse([query for query in cached.captured_queries if 'lets_play_app_reservation' in query['sql']])
+        self.assertEqual(self.stats('sport_center_detail', 'fragment'), (1, 1))
+        self.assertContains(self.client.get(self.detail_url), '<td>1</td>')
+
+        Rooms.objects.create(room_number=2, sport_center=self.sport_center)
+        self.assertContains(self.client.get(self.detail_url), '<td>2</td>')
+
+    def test_release_is_part_of_the_key(self):
+        key = page_cache.make_key('sport_centres', [page_cache.SPORT_CENTRES])
+        with mock.patch('lets_play_app.page_cache._release', 'next-deploy'):
+            self.assertNotEqual(page_cache.make_key('sport_centres', [page_cache.SPORT_CENTRES]), key)
+
+    def test_admin_stats_page(self):
+        self.client.get('/sport_centres/')
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 302)
+        MyUser.objects.create_superuser(username='admin', email='admin@example.com', password='secret123')
+        self.client.login(username='admin', password='secret123')
+        self.assertContains(self.client.get(reverse('cache_stats')), '<td>sport_centres</td>', count=2)
+        self.client.post(reverse('cache_stats'))
+        self.assertEqual(self.stats('sport_centres', 'view'), (0, 0))
+
+
+class MatchmakingTest(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        UserStats.objects.create(user=self.user, ranking=10)
+        self.home = create_sport_center('Home Court')
+        self.other = create_sport_center('Far Away')
+        self.today = datetime.date.today()
+
+    def host(self, name, skill, ranking=0):
+        host = MyUser.objects.create_user(username=name, password='secret123', skill=skill)
+        UserStats.objects.create(user=host, ranking=ranking)
+        return host
+
+    def room(self, host, days, location=None, partner=None):
+        return Reservation.objects.create(user_main=host, user_partner=partner, location=location or self.home,
+                                          date=self.today + datetime.timedelta(days=days),
+                                          time_start=datetime.time(18), time_end=datetime.time(19))
+
+    def test_candidates_are_ranked(self):
+        rival = self.host('rival', 2, ranking=10)
+        best = self.room(rival, 1)
+        later = self.room(rival, 20)
+        other_centre = self.room(self.host('traveller', 2, ranking=10), 1, location=self.other)
+        weaker = self.room(self.host('weaker', 1, ranking=10), 1)
+        self.room(self.host('master', 4, ranking=10), 1)
+        self.room(rival, 1, partner=self.host('taken', 2))
+        self.room(self.user, 1)
+
+        matches = matchmaking.rank(self.user, locations=[self.home.pk])
+        self.assertEqual([match.reservation_id for match in matches], [best.pk, other_centre.pk, later.pk, weaker.pk])
+
+    def test_head_to_head_and_played_centres(self):
+        familiar, stranger = self.host('familiar', 2), self.host('stranger', 2)
+        self.room(self.user, -10, location=self.other, partner=familiar)
+        rematch = self.room(familiar, 1, location=self.other)
+        new_opponent = self.room(stranger, 1, location=self.other)
+        unknown_centre = self.room(stranger, 1)
+
+        matches = matchmaking.rank(self.user)
+        self.assertEqual([match.reservation_id for match in matches], [new_opponent.pk, rematch.pk, unknown_centre.pk])
+        self.assertEqual(matches[1].games_played, 1)
+
+    def test_ranking_band_is_filtered_before_the_cap(self):
+        for i in range(3):
+            self.room(self.host('far%s' % i, 2, ranking=10 + matchmaking.MAX_RANKING_DISTANCE + 1), 0)
+        close = self.room(self.host('close', 2, ranking=10), 5)
+        with mock.patch.object(matchmaking, 'CANDIDATE_LIMIT', 2):
+            matches = matchmaking.rank(self.user)
+        self.assertEqual([match.reservation_id for match in matches], [close.pk])
+
+        # Within the band the cap keeps the nearest dates and drops the later rooms.
+        near = [self.room(self.host('near%s' % i, 2, ranking=10), 1) for i in range(2)]
+        with mock.patch.object(matchmaking, 'CANDIDATE_LIMIT', 2):
+            matches = matchmaking.rank(self.user)
+        self.assertEqual({match.reservation_id for match in matches}, {room.pk for room in near})
+
+    def test_suggestions_use_bounded_queries(self):
+        for i in range(30):
+            self.room(self.host('host%s' % i, 2, ranking=i), i % 10)
+        # Ranking, preferred centres, games against the hosts, candidates and the listing.
+        with self.assertNumQueries(5):
+            suggestions = matchmaking.suggested_reservations(self.user, limit=5)
+        self.assertEqual(len(suggestions), 5)
+        self.assertEqual(suggestions[0].match.days_away, 0)
+        self.assertEqual(suggestions[0].user_main.stats.ranking, 10)
+
+        self.client.login(username='player', password='secret123')
+        self.assertContains(self.client.get(reverse('reservations_list')), 'Proponowane mecze')
+
+
+class CalendarFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.rival = MyUser.objects.create_user(username='rival', password='secret123', skill=2)
+        self.url = reverse('calendar_feed', args=[ical.feed_token(self.user)])
+
+    def game(self, days, partner=None, comment=None):
+        return Reservation.objects.create(user_main=self.user, user_partner=partner, location=self.sport_center,
+                                          date=datetime.date.today() + datetime.timedelta(days=days),
+                                          time_start=datetime.time(18), time_end=datetime.time(19),
+                                          comment=comment)
+
+    def get_feed(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content).decode('utf-8') if response.status_code == 200 else ''
+
+    def test_feed_lists_upcoming_and_past_games(self):
+        upcoming = self.game(3, partner=self.rival, comment='Kort nr 2, przy oknie; ' + 'ł' * 80)
+        past = self.game(-3, partner=self.rival)
+        Score.objects.create(room=past, user_main_score=3, user_partner_score=1)
+        self.game(5)  # nobody joined yet, not a game
+
+        response, body = self.get_feed()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('UID:reservation-%s@lets-play' % upcoming.pk, body)
+        self.assertIn('SUMMARY:Squash: rival', body)
+        self.assertIn('DESCRIPTION:Wynik 3 : 1', body)
+        self.assertIn('COMMENT:Kort nr 2\\, przy oknie\\; ', body)
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in body.split('\r\n')))
+
+    def test_etag_changes_with_games(self):
+        self.game(3, partner=self.rival)
+        response, body = self.get_feed()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.game(4, partner=self.rival)
+        response, body = self.get_feed(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+
+    def test_bad_token(self):
+        self.assertEqual(self.client.get('/calendar/%s:forged.ics' % self.user.pk).status_code, 404)
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.client.login(username='player', password='secret123')
+        self.hosts = [MyUser.objects.create_user(username='host%s' % i, password='secret123', skill=2)
+                      for i in range(5)]
+        today = datetime.date.today()
+        self.rooms = [Reservation.objects.create(user_main=host, location=self.sport_center,
+                                                 date=today + datetime.timedelta(days=i + 1),
+                                                 time_start=datetime.time(18), time_end=datetime.time(19))
+                      for i, host in enumerate(self.hosts)]
+
+    def test_rooms_pagination_and_fields(self):
+        response = self.client.get(reverse('api_rooms'), {'limit': 3, 'fields': 'id,host'})
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': room.pk, 'host': room.user_main.username} for room in self.rooms[:3]])
+        self.assertIsNone(data['previous'])
+
+        with self.assertNumQueries(3):  # session, user, page
+            data = self.client.get(reverse('api_rooms'), {'limit': 3, 'after': data['next']}).json()
+        self.assertEqual([row['id'] for row in data['results']], [room.pk for room in self.rooms[3:]])
+        self.assertEqual(set(data['results'][0]), {'id', 'date', 'time_start', 'time_end', 'location_name', 'host'})
+        self.assertIsNone(data['next'])
+
+    def test_rooms_filters_and_errors(self):
+        tomorrow = (datetime.date.today() + datetime.timedelta(days=2)).isoformat()
+        data = self.client.get(reverse('api_rooms'), {'date_end': tomorrow, 'fields': 'id'}).json()
+        self.assertEqual(data['results'], [{'id': self.rooms[0].pk}, {'id': self.rooms[1].pk}])
+        self.assertEqual(self.client.get(reverse('api_rooms'), {'skill': 4}).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('api_rooms'), {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_rooms'), {'after': 'garbage'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_rooms')).status_code, 401)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('api_rooms'))
+        self.assertEqual(self.client.get(reverse('api_rooms'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.rooms[0].delete()
+        self.assertEqual(self.client.get(reverse('api_rooms'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        response = self.client.get(reverse('api_sport_centres'))
+        self.assertEqual(response.json()['results'][0]['name'], 'Squash Arena')
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('api_sport_centres'),
+                                             HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_history_and_standings(self):
+        past = Reservation.objects.create(user_main=self.user, user_partner=self.hosts[0], location=self.sport_center,
+                                          date=datetime.date.today() - datetime.timedelta(days=1),
+                                          time_start=datetime.time(18), time_end=datetime.time(19))
+        score = Score.objects.create(room=past, user_main_score=3, user_partner_score=0)
+        score.confirm(self.user)
+        score.confirm(self.hosts[0])
+
+        history = self.client.get(reverse('api_history')).json()['results']
+        self.assertEqual([(row['id'], row['user_main_score']) for row in history], [(past.pk, 3)])
+        standings = self.client.get(reverse('api_standings', args=[2])).json()['results']
+        self.assertEqual([row['username'] for row in standings], ['player', 'host0'])
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        call_command('benchmark_api', repeat=2, user='player', stdout=output)
+        self.assertIn('api_standings', output.getvalue())
+
+
+class JoinRoomTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.host = MyUser.objects.create_user(username='host', password='secret123', skill=2)
+        self.guest = MyUser.objects.create_user(username='guest', password='secret123', skill=2)
+        self.room = Reservation.objects.create(user_main=self.host, location=self.sport_center,
+                                               date=datetime.date.today() + datetime.timedelta(days=1),
+                                               time_start=datetime.time(18), time_end=datetime.time(19))
+
+    def join(self, username, room_id=None):
+        self.client.login(username=username, password='secret123')
+        return self.client.post(reverse('api_join_room', args=[room_id or self.room.pk]))
+
+    def test_statuses(self):
+        self.assertEqual(self.client.post(reverse('api_join_room', args=[self.room.pk])).status_code, 401)
+        self.assertEqual(self.join('host').status_code, 403)
+        self.assertEqual(self.join('guest', room_id=self.room.pk + 100).status_code, 404)
+        response = self.join('guest')
+        self.assertEqual(response.json(), {'id': self.room.pk, 'user_partner_id': self.guest.pk})
+        MyUser.objects.create_user(username='late', password='secret123', skill=2)
+        self.assertEqual(self.join('late').status_code, 409)
+        self.assertEqual(Reservation.objects.get(pk=self.room.pk).user_partner, self.guest)
+        self.assertEqual(Notification.objects.filter(user=self.host, event=Notification.JOINED).count(), 1)
+
+    def test_past_room_cannot_be_joined(self):
+        Reservation.objects.filter(pk=self.room.pk).update(date=datetime.date.today() - datetime.timedelta(days=1))
+        self.assertEqual(self.join('guest').json()['error'], 'Rezerwacja już się odbyła.')
+
+    def test_join_invalidates_caches(self):
+        feed_etag = ical.feed_etag(self.guest.pk)
+        scope = page_cache.sport_center_scope(self.sport_center.slug)
+        generation = page_cache.generations([scope])
+        self.assertTrue(self.room.join(self.guest))
+        self.assertNotEqual(ical.feed_etag(self.guest.pk), feed_etag)
+        self.assertNotEqual(page_cache.generations([scope]), generation)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentJoinTest(TransactionTestCase):
+    PLAYERS = 16
+
+    def setUp(self):
+        sport_center = create_sport_center()
+        host = MyUser.objects.create_user(username='host', password='secret123', skill=2)
+        self.players = [MyUser.objects.create_user(username='player%s' % i, password='secret123', skill=2)
+                        for i in range(self.PLAYERS)]
+        self.room = Reservation.objects.create(user_main=host, location=sport_center,
+                                               date=datetime.date.today() + datetime.timedelta(days=1),
+                                               time_start=datetime.time(18), time_end=datetime.time(19))
+
+    def join(self, player, barrier):
+        try:
+            # Every thread reads the room while it is still open, as a page rendered a moment ago would.
+            room = Reservation.objects.get(pk=self.room.pk)
+            barrier.wait()
+            return room.join(player)
+        finally:
+            connections.close_all()
+
+    def test_exactly_one_winner(self):
+        barrier = threading.Barrier(self.PLAYERS)
+        with ThreadPoolExecutor(max_workers=self.PLAYERS) as pool:
+            results = list(pool.map(self.join, self.players, [barrier] * self.PLAYERS))
+        self.assertEqual(results.count(True), 1)
+        winner = self.players[results.index(True)]
+        self.assertEqual(Reservation.objects.get(pk=self.room.pk).user_partner, winner)
+        self.assertEqual(list(Notification.objects.values_list('event', flat=True)), [Notification.JOINED])
+
+
+class HousekeepingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.host = MyUser.objects.create_user(username='host', password='secret123', skill=2)
+        self.guest = MyUser.objects.create_user(username='guest', password='secret123', skill=2)
+
+    def room(self, days, user_partner=None):
+        return Reservation.objects.create(user_main=self.host, user_partner=user_partner, location=self.sport_center,
+                                          date=datetime.date.today() + datetime.timedelta(days=days),
+                                          time_start=datetime.time(18), time_end=datetime.time(19))
+
+    def test_expired_rooms(self):
+        expired = [self.room(-days) for days in range(1, 6)]
+        kept = [self.room(-1, user_partner=self.guest), self.room(0), self.room(3)]
+        feed_etag = ical.feed_etag(self.host.pk)
+        report = housekeeping.delete_expired_rooms(batch_size=2)
+        self.assertEqual(report.rows, len(expired))
+        self.assertEqual(report.batches, 3)
+        self.assertEqual(sorted(Reservation.objects.values_list('pk', flat=True)), [room.pk for room in kept])
+        self.assertNotEqual(ical.feed_etag(self.host.pk), feed_etag)
+
+    def test_old_read_messages_and_expired_sessions(self):
+        old = timezone.now() - datetime.timedelta(days=housekeeping.MESSAGES_RETENTION_DAYS + 1)
+        for is_read in (True, True, False):
+            Messages.objects.create(user=self.host, content='old', is_read=is_read)
+        Messages.objects.update(date=old)
+        recent = Messages.objects.create(user=self.host, content='recent', is_read=True)
+        self.assertEqual(housekeeping.delete_read_messages(batch_size=1).rows, 2)
+        self.assertEqual(sorted(Messages.objects.values_list('content', flat=True)), ['old', recent.content])
+
+        self.client.login(username='host', password='secret123')
+        Session.objects.create(session_key='expired', session_data='', expire_date=old)
+        self.assertEqual(housekeeping.clear_expired_sessions().rows, 1)
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_command(self):
+        self.room(-1)
+        output = StringIO()
+        call_command('housekeeping', 'rooms', stdout=output)
+        self.assertIn('rooms', output.getvalue())
+        self.assertIn('rows/s', output.getvalue())
+        self.assertFalse(Reservation.objects.exists())
+
+
+class DatabaseConnectionsTest(TestCase):
+    def test_health_check_closes_broken_connections(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=True), \
+                mock.patch.object(connection, 'close') as close:
+            check_connections()
+        self.assertFalse(close.called)
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            check_connections()
+        self.assertTrue(close.called)
+
+    def test_benchmark_command(self):
+        create_sport_center()
+        output = StringIO()
+        call_command('benchmark_connections', requests=3, stdout=output)
+        self.assertIn('persistent + checks', output.getvalue())
+        self.assertEqual(connection.settings_dict.get('CONN_MAX_AGE', 0), 0)
+
+
+class BulkScoresTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        self.organizer = MyUser.objects.create_user(username='organizer', password='secret123', is_staff=True)
+        self.client.login(username='organizer', password='secret123')
+        self.players = [MyUser.objects.create_user(username='player%s' % i, password='secret123', skill=2)
+                        for i in range(4)]
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.rooms = [Reservation.objects.create(user_main=main, user_partner=partner, location=self.sport_center,
+                                                 date=yesterday, time_start=datetime.time(18 + i),
+                                                 time_end=datetime.time(19 + i))
+                      for i, (main, partner) in enumerate(zip(self.players, self.players[1:] + self.players[:1]))]
+
+    def upload(self, lines, **data):
+        csv_file = SimpleUploadedFile('scores.csv', '\n'.join(lines).encode('utf-8'))
+        return self.client.post(reverse('bulk_scores'), dict(action='upload', csv_file=csv_file, **data))
+
+    def stats(self):
+        return sorted(UserStats.objects.values_list('user_id', 'games_played', 'games_won', 'sets_won', 'rating'))
+
+    def test_csv_is_all_or_nothing(self):
+        future = Reservation.objects.create(user_main=self.players[0], user_partner=self.players[1],
+                                            location=self.sport_center, time_start=datetime.time(18),
+                                            time_end=datetime.time(19),
+                                            date=datetime.date.today() + datetime.timedelta(days=1))
+        response = self.upload(['room_id,user_main_score,user_partner_score',
+                                '%s,3,1' % self.rooms[0].pk, '%s,2,2' % self.rooms[1].pk, '%s,3,0' % future.pk])
+        self.assertEqual(response.context['upload_form'].non_field_errors(),
+                         ['Wiersz 3: mecz nie może zakończyć się remisem.',
+                          'Wiersz 4: mecz %s jeszcze się nie odbył.' % future.pk])
+        self.assertFalse(Score.objects.exists())
+
+        response = self.upload(['room_id,user_main_score,user_partner_score'] +
+                               ['%s,3,%s' % (room.pk, i) for i, room in enumerate(self.rooms[:3])])
+        self.assertRedirects(response, reverse('bulk_scores'))
+        self.assertEqual(Score.objects.filter(is_confirmed_by_user_main=False).count(), 3)
+        self.assertFalse(UserStats.objects.exists())
+
+    def test_entry_form_with_confirmation(self):
+        data = {'action': 'enter', 'confirmed': 'on'}
+        for i, room in enumerate(self.rooms):
+            data['main_%s' % room.pk], data['partner_%s' % room.pk] = 3, i % 3
+        response = self.client.post(reverse('bulk_scores'), data)
+        self.assertRedirects(response, reverse('bulk_scores'))
+        stats = self.stats()
+        self.assertEqual([row[1] for row in stats], [2] * 4)
+        self.assertEqual(RatingHistory.objects.count(), 8)
+        UserStats.objects.rebuild()
+        self.assertEqual(self.stats(), stats)
+
+    def test_bulk_confirm_is_one_update(self):
+        bulk_scores.create([(line, room.pk, 3, 1) for line, room in enumerate(self.rooms, 1)])
+        score_ids = list(Score.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk_scores'), {'action': 'confirm', 'scores': score_ids})
+        self.assertRedirects(response, reverse('bulk_scores'), fetch_redirect_response=False)
+        score_updates = [query for query in queries.captured_queries
+                         if query['sql'].startswith('UPDATE "lets_play_app_score"')]
+        self.assertEqual(len(score_updates), 1)
+        self.assertEqual(Notification.objects.filter(event=Notification.SCORE_CONFIRMED).count(), 8)
+        stats = self.stats()
+        UserStats.objects.rebuild()
+        self.assertEqual(self.stats(), stats)
+
+        response = self.client.get(reverse('bulk_scores'))
+        self.assertEqual(response.context['pending'], [])
+        self.assertEqual(response.context['entry_form'].rooms, [])
+
+    def test_bulk_confirm_locks_the_pending_scores(self):
+        scores = bulk_scores.create([(line, room.pk, 3, 1) for line, room in enumerate(self.rooms, 1)])
+        scores[0].confirm(self.players[0])
+        scores[0].confirm(self.players[1])
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update) as lock:
+            confirmed = bulk_scores.confirm([score.pk for score in scores])
+        self.assertTrue(lock.called)
+        self.assertEqual(sorted(score.pk for score in confirmed), sorted(score.pk for score in scores[1:]))
+        self.assertEqual(Notification.objects.filter(event=Notification.SCORE_CONFIRMED).count(), 8)
+
+    def test_confirm_replays_from_the_earliest_match_only(self):
+        bystander = MyUser.objects.create_user(username='bystander', password='secret123', skill=4)
+        earlier = Reservation.objects.create(user_main=self.players[0], user_partner=bystander,
+                                             location=self.sport_center, time_start=datetime.time(18),
+                                             time_end=datetime.time(19),
+                                             date=datetime.date.today() - datetime.timedelta(days=10))
+        bulk_scores.create([(1, earlier.pk, 3, 0)], confirmed=True)
+        kept = list(RatingHistory.objects.filter(score__room=earlier).values_list('pk', 'rating'))
+        versions = leaderboard.version(2), leaderboard.version(4)
+
+        bulk_scores.create([(line, room.pk, 3, 1) for line, room in enumerate(self.rooms[:2], 1)], confirmed=True)
+        self.assertEqual(list(RatingHistory.objects.filter(score__room=earlier).values_list('pk', 'rating')), kept)
+        self.assertNotEqual(leaderboard.version(2), versions[0])
+        self.assertEqual(leaderboard.version(4), versions[1])
+
+        def ratings():
+            return sorted((user_id, round(rating, 6)) for user_id, rating in
+                          RatingHistory.objects.values_list('user_id', 'rating'))
+        replayed, stats = ratings(), [row[:4] + (round(row[4], 6),) for row in self.stats()]
+        UserStats.objects.rebuild()
+        self.assertEqual(ratings(), replayed)
+        self.assertEqual([row[:4] + (round(row[4], 6),) for row in self.stats()], stats)
+
+    def test_organizers_only(self):
+        self.client.login(username='player0', password='secret123')
+        self.assertEqual(self.client.get(reverse('bulk_scores')).status_code, 302)
+
+
+class LeagueDumpTest(TestCase):
+    def setUp(self):
+        sport_center = create_sport_center()
+        Rooms.objects.create(sport_center=sport_center, room_number=1)
+        players = [MyUser.objects.create_user(username='gracz%s' % i, password='secret123', skill=2) for i in range(2)]
+        room = Reservation.objects.create(user_main=players[0], user_partner=players[1], location=sport_center,
+                                          date=datetime.date.today() - datetime.timedelta(days=1),
+                                          time_start=datetime.time(18), time_end=datetime.time(19), comment='żółw')
+        score = Score.objects.create(room=room, user_main_score=3, user_partner_score=1)
+        score.confirm(players[0])
+        score.confirm(players[1])
+        Messages.objects.create(user=players[0], content='stara wiadomość')
+        Messages.objects.update(date=timezone.now() - datetime.timedelta(days=400))
+
+    def snapshot(self):
+        return [list(model._base_manager.order_by('pk').values_list()) for model in league_dump.MODELS]
+
+    def delete_all(self):
+        for model in reversed(league_dump.MODELS):
+            model._base_manager.all().delete()
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        output = StringIO()
+        exported = league_dump.export(output)
+        self.assertEqual(sum(result.rows for result in exported), sum(len(rows) for rows in before))
+        self.assertRaises(league_dump.DumpError, league_dump.load, output.getvalue().splitlines())
+
+        self.delete_all()
+        imported = league_dump.load(output.getvalue().splitlines(), batch_size=2)
+        self.assertEqual([result.rows for result in imported], [result.rows for result in exported])
+        self.assertEqual(self.snapshot(), before)
+        # Sequences continue after the imported ids.
+        self.assertGreater(create_sport_center('Nowe Centrum').pk, before[1][-1][0])
+
+    def test_commands(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'league.ndjson.gz')
+        before = self.snapshot()
+        output = StringIO()
+        call_command('export_league', path, stdout=output)
+        self.assertIn('rows/s', output.getvalue())
+        self.delete_all()
+        call_command('import_league', path, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.arena = create_sport_center()
+        self.hall = create_sport_center('Hala Sportowa')
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+        self.rival = MyUser.objects.create_user(username='rival', password='secret123', skill=2)
+        self.friend = MyUser.objects.create_user(username='friend', password='secret123', skill=2)
+
+    def game(self, main, partner, location, score=None, days=-1):
+        room = Reservation.objects.create(user_main=main, user_partner=partner, location=location,
+                                          date=datetime.date.today() + datetime.timedelta(days=days),
+                                          time_start=datetime.time(18), time_end=datetime.time(19))
+        if score is not None:
+            Score.objects.create(room=room, user_main_score=score[0], user_partner_score=score[1],
+                                 is_confirmed_by_user_main=True, is_confirmed_by_user_partner=True)
+        return room
+
+    def test_records_from_either_side(self):
+        self.game(self.user, self.rival, self.arena, (3, 1))
+        self.game(self.rival, self.user, self.arena, (3, 2))
+        self.game(self.rival, self.user, self.hall, (0, 3))
+        self.game(self.friend, self.user, self.hall, (1, 3))
+        unconfirmed = self.game(self.user, self.friend, self.hall)
+        Score.objects.create(room=unconfirmed, user_main_score=3, user_partner_score=0)
+        self.game(self.user, self.friend, self.arena, days=3)
+
+        result = analytics.player_analytics(self.user.pk)
+        self.assertEqual(result.head_to_head, [
+            analytics.Record(self.rival.pk, 'rival', 3, 2, 8, 4),
+            analytics.Record(self.friend.pk, 'friend', 1, 1, 3, 1),
+        ])
+        self.assertEqual([(record.name, record.games, record.won) for record in result.centres],
+                         [('Hala Sportowa', 2, 2), ('Squash Arena', 2, 1)])
+        self.assertEqual(result.centres[1].win_rate, 50.0)
+        self.assertEqual(result.partners, [analytics.Partner(self.friend.pk, 'friend', 3),
+                                           analytics.Partner(self.rival.pk, 'rival', 3)])
+
+    def test_profile_tab_query_budget(self):
+        url = reverse('profile_stats', args=[self.user.pk])
+        for i in range(3):
+            self.game(self.user, self.rival, self.arena, (3, i))
+        with self.assertNumQueries(4):  # user, head to head, centres, partners
+            response = self.client.get(url)
+        self.assertContains(response, 'rival')
+        for i in range(10):
+            self.game(self.friend, self.user, self.hall, (3, i % 3))
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Hala Sportowa')
+
+    def test_navigation_keeps_the_logged_in_player(self):
+        self.client.login(username='friend', password='secret123')
+        response = self.client.get(reverse('profile_stats', args=[self.user.pk]))
+        self.assertEqual(response.context['user'], self.friend)
+        self.assertContains(response, 'href="%s"' % reverse('profile', args=[self.friend.pk]))
+        self.assertContains(response, 'href="%s"' % reverse('profile_stats', args=[self.user.pk]))
+
+    def test_confirmed_score_invalidates(self):
+        room = self.game(self.user, self.rival, self.arena)
+        self.assertEqual(analytics.player_analytics(self.user.pk).head_to_head, [])
+        score = Score.objects.create(room=room, user_main_score=3, user_partner_score=0)
+        score.confirm(self.user)
+        self.assertEqual(analytics.player_analytics(self.rival.pk).head_to_head, [])
+        score.confirm(self.rival)
+        self.assertEqual(analytics.player_analytics(self.rival.pk).head_to_head,
+                         [analytics.Record(self.user.pk, 'player', 1, 0, 0, 3)])
+
+        other = self.game(self.user, self.rival, self.hall)
+        bulk_scores.create([(1, other.pk, 0, 3)], confirmed=True)
+        self.assertEqual(analytics.player_analytics(self.user.pk).head_to_head[0].lost, 1)
+
+
+class UtilizationTest(TestCase):
+    monday = datetime.date(2024, 1, 1)
+
+    def setUp(self):
+        self.arena = create_sport_center()
+        self.hall = create_sport_center('Hala Sportowa')
+        for number, available in ((1, True), (2, True), (3, False)):
+            Rooms.objects.create(sport_center=self.arena, room_number=number, availability=available)
+        self.user = MyUser.objects.create_user(username='player', password='secret123', skill=2)
+
+    def book(self, location, days, time_start, time_end, count=1):
+        for i in range(count):
+            Reservation.objects.create(user_main=self.user, location=location,
+                                       date=self.monday + datetime.timedelta(days=days),
+                                       time_start=time_start, time_end=time_end)
+
+    def test_weekday_counts(self):
+        self.assertEqual(utilization.weekday_counts(self.monday, self.monday + datetime.timedelta(days=14)).tolist(),
+                         [3, 2, 2, 2, 2, 2, 2])
+
+    def test_report_bins_hours_against_capacity(self):
+        self.book(self.arena, 0, datetime.time(18), datetime.time(19, 30), count=3)
+        self.book(self.arena, 8, datetime.time(10, 30), datetime.time(11))
+        self.book(self.arena, 14, datetime.time(18), datetime.time(19))  # after the period
+        self.book(self.hall, 2, datetime.time(12), datetime.time(13))
+
+        report = utilization.report(self.monday, self.monday + datetime.timedelta(days=13))
+        hour = list(utilization.HOURS).index
+        rates = utilization.rates(report.booked, report.available)
+        self.assertEqual(report.available[0, 0, 0], 4)
+        self.assertEqual(report.booked[0].sum(), 5)
+        self.assertEqual(rates[0, 0, hour(18)], 0.75)
+        self.assertEqual(rates[0, 0, hour(19)], 0.375)
+        self.assertEqual(rates[0, 1, hour(10)], 0.125)
+        self.assertEqual(report.booked[1, 2, hour(12)], 1)
+        self.assertEqual(rates[1].sum(), 0)
+
+        grids = utilization.heatmap(report)
+        self.assertEqual([(grid.sport_center, grid.courts) for grid in grids], [(self.arena, 2), (self.hall, 0)])
+        self.assertEqual(grids[0].rows[0][1][hour(18)].percent, 75)
+
+    def test_admin_page_and_csv(self):
+        MyUser.objects.create_user(username='organizer', password='secret123', is_staff=True)
+        self.client.login(username='organizer', password='secret123')
+        self.book(self.arena, 0, datetime.time(18), datetime.time(19), count=3)
+        query = {'date_start': '2024-01-01', 'date_end': '2024-01-07'}
+
+        response = self.client.get(reverse('utilization'), query)
+        self.assertContains(response, 'Hala Sportowa')
+        self.assertContains(response, '220, 53, 69')  # three games on two courts
+
+        response = self.client.get(reverse('utilization_csv'), query)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ','.join(utilization.CSV_COLUMNS))
+        self.assertEqual(len(lines), 1 + 2 * 7 * len(utilization.HOURS))
+        self.assertIn('%s,Squash Arena,Pon,18:00,3.00,2,1.500' % self.arena.pk, lines)
+
+        response = self.client.get(reverse('utilization_csv'), {'date_start': '2024-01-07', 'date_end': '2024-01-01'})
+        self.assertContains(response, 'Data końcowa musi być późniejsza niż początkowa.')
+
+
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sport_center = create_sport_center()
+        MyUser.objects.create_superuser(username='admin', email='admin@example.com', password='secret123')
+        self.client.login(username='admin', password='secret123')
+        self.players = [MyUser.objects.create_user(username='player%s' % i, password='secret123', skill=2)
+                        for i in range(2)]
+
+    def room(self, partner=None, days=1):
+        return Reservation.objects.create(user_main=self.players[0], user_partner=partner, location=self.sport_center,
+                                          date=datetime.date.today() + datetime.timedelta(days=days),
+                                          time_start=datetime.time(18), time_end=datetime.time(19))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        urls = [reverse('admin:lets_play_app_reservation_changelist'), reverse('admin:lets_play_app_rooms_changelist'),
+                reverse('admin:lets_play_app_score_changelist')]
+
+        def add_rows(count):
+            for i in range(count):
+                Rooms.objects.create(sport_center=self.sport_center, room_number=i)
+                room = self.room(partner=self.players[1], days=-1)
+                Score.objects.create(room=room, user_main_score=3, user_partner_score=i % 3)
+
+        add_rows(2)
+        few = [self.count_queries(url) for url in urls]
+        add_rows(10)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_foreign_keys_are_raw_ids(self):
+        response = self.client.get(reverse('admin:lets_play_app_reservation_change', args=[self.room().pk]))
+        self.assertContains(response, 'vForeignKeyRawIdAdminField', count=2)
+        self.assertNotContains(response, '>player1</option>')
+
+    def test_delete_open_rooms_is_one_delete(self):
+        open_room, joined = self.room(), self.room(partner=self.players[1])
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('admin:lets_play_app_reservation_changelist'),
+                             {'action': 'delete_open_rooms', '_selected_action': [open_room.pk, joined.pk]})
+        deletes = [query for query in context.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(list(Reservation.objects.values_list('pk', flat=True)), [joined.pk])
+
+    def test_confirm_and_mark_read_actions(self):
+        score = Score.objects.create(room=self.room(partner=self.players[1], days=-1), user_main_score=3,
+                                     user_partner_score=1)
+        self.client.post(reverse('admin:lets_play_app_score_changelist'),
+                         {'action': 'confirm', '_selected_action': [score.pk]})
+        self.assertEqual(UserStats.objects.get(user=self.players[0]).games_won, 1)
+
+        message = Messages.objects.create(user=self.players[0], content='Witaj')
+        self.assertEqual(inbox.unread_count(self.players[0].pk), 1)
+        self.client.post(reverse('admin:lets_play_app_messages_changelist'),
+                         {'action': 'mark_read', '_selected_action': [message.pk]})
+        self.assertEqual(inbox.unread_count(self.players[0].pk), 0)
+
+    def test_estimated_count(self):
+        reservations = Reservation.objects.order_by('pk')
+        self.room()
+        self.assertEqual(EstimatedCountPaginator(reservations, 50).count, 1)
+        with mock.patch('lets_play_app.pagination.estimated_count', return_value=250000):
+            self.assertEqual(EstimatedCountPaginator(reservations, 50).count, 250000)
+        with mock.patch('lets_play_app.pagination.estimated_count', return_value=500):
+            self.assertEqual(EstimatedCountPaginator(reservations, 50).count, 1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Court utilization of every sport centre by weekday and opening hour, compared with its court capacity.
+
+The database groups the reservations of the period by centre, weekday and start/end time, which leaves a few
+thousand rows however many years are covered, and NumPy spreads those over the hourly bins at once instead of
+walking the reservations one by one.
+"""
+
+import csv
+import datetime
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Count
+from django.db.models.functions import ExtractWeekDay
+
+from .availability import OPENING_TIME, CLOSING_TIME
+from .models import SportCenter, Reservation
+
+HOURS = np.arange(OPENING_TIME.hour, CLOSING_TIME.hour)
+WEEKDAYS = ('Pon', 'Wt', 'Śr', 'Czw', 'Pt', 'Sob', 'Nd')
+DEFAULT_WEEKS = 12
+CSV_COLUMNS = ('sport_center_id', 'sport_center', 'weekday', 'hour', 'booked_hours', 'available_hours',
+               'utilization')
+
+# ``booked`` and ``available`` are court hours shaped (centre, weekday, hour), Monday first.
+Report = namedtuple('Report', 'date_start date_end centres booked available')
+
+
+class Cell(namedtuple('Cell', 'booked rate')):
+    @property
+    def percent(self):
+        return 100.0 * self.rate
+
+    @property
+    def shade(self):
+        # Opacity of the heatmap cell, formatted here because the template would localize the decimal point.
+        return '%.2f' % min(self.rate, 1.0)
+
+
+CentreGrid = namedtuple('CentreGrid', 'sport_center courts percent rows')
+
+
+def default_period(today=None):
+    today = today or datetime.date.today()
+    return today - datetime.timedelta(weeks=DEFAULT_WEEKS) + datetime.timedelta(days=1), today
+
+
+def weekday_counts(date_start, date_end):
+    """How many Mondays, Tuesdays, ... there are from ``date_start`` to ``date_end`` inclusive."""
+    days = np.arange(np.datetime64(date_start, 'D'), np.datetime64(date_end, 'D') + 1).astype(np.int64)
+    # Day 0 of datetime64 is Thursday 1970-01-01.
+    return np.bincount((days + 3) % 7, minlength=7)
+
+
+def bin_hours(starts, ends, counts):
+    """Court hours that ``counts`` reservations from ``starts`` to ``ends`` (minutes) take in every bin of HOURS."""
+    bins = HOURS * 60
+    overlap = np.minimum(ends[:, None], bins + 60) - np.maximum(starts[:, None], bins)
+    return np.clip(overlap, 0, 60) * counts[:, None] / 60.0
+
+
+def report(date_start, date_end):
+    """Booked against available court hours of every centre over the period, from one grouped query."""
+    centres = list(SportCenter.objects.with_capacity().order_by('pk'))
+    rows = Reservation.objects.filter(date__gte=date_start, date__lte=date_end)\
+        .annotate(weekday=ExtractWeekDay('date'))\
+        .values_list('location_id', 'weekday', 'time_start', 'time_end')\
+        .annotate(count=Count('id')).order_by()
+    # Grouping leaves few rows, so turning their times into minutes here costs nothing.
+    table = np.array([(location_id, weekday, start.hour * 60 + start.minute, end.hour * 60 + end.minute, count)
+                      for location_id, weekday, start, end, count in rows], dtype=np.int64).reshape(-1, 5)
+    location_ids, weekdays, starts, ends, counts = table.T
+
+    booked = np.zeros((len(centres), 7, len(HOURS)))
+    # Every reservation points at an existing centre, so its position in the sorted ids is its row.
+    positions = np.searchsorted(np.array([centre.pk for centre in centres], dtype=np.int64), location_ids)
+    # ExtractWeekDay counts from Sunday = 1.
+    np.add.at(booked, (positions, (weekdays + 5) % 7), bin_hours(starts, ends, counts))
+
+    # The courts open today are assumed for the whole period, there is no history of closed courts.
+    capacity = np.array([centre.capacity or 0 for centre in centres], dtype=np.float64)
+    available = np.zeros_like(booked) + capacity[:, None, None] * weekday_counts(date_start, date_end)[None, :, None]
+    return Report(date_start, date_end, centres, booked, available)
+
+
+def rates(booked, available):
+    """Booked share of the available hours; 0 where a centre has no courts. Over 1 means overbooked."""
+    return np.divide(booked, available, out=np.zeros_like(booked), where=available > 0)
+
+
+def heatmap(report):
+    """Weekday by hour grid of every centre for the admin page."""
+    grids = []
+    utilization = rates(report.booked, report.available)
+    for position, centre in enumerate(report.centres):
+        available = report.available[position].sum()
+        percent = 100.0 * report.booked[position].sum() / available if available else 0.0
+        rows = [(day, [Cell(booked, rate) for booked, rate in
+                       zip(report.booked[position, weekday].tolist(), utilization[position, weekday].tolist())])
+                for weekday, day in enumerate(WEEKDAYS)]
+        grids.append(CentreGrid(centre, centre.capacity or 0, float(percent), rows))
+    return grids
+
+
+def write_csv(report, output):
+    """One line per centre, weekday and hour, in the order of the admin page."""
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    utilization = rates(report.booked, report.available)
+    for position, centre in enumerate(report.centres):
+        for weekday, day in enumerate(WEEKDAYS):
+            for column, hour in enumerate(HOURS.tolist()):
+                writer.writerow([centre.pk, centre.name, day, '%02d:00' % hour,
+                                 '%.2f' % report.booked[position, weekday, column],
+                                 '%.0f' % report.available[position, weekday, column],
+                                 '%.3f' % utilization[position, weekday, column]])
@@ -2,21 +2,39 @@
 # -*- coding: utf-8 -*- 
 
 import datetime
+from functools import partial
+
+from django.contrib import admin, messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse, FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.db.models import Q
-
-from .models import SportCenter, Reservation, MyUser, UserStats, Score, Messages
-from .forms import CreateReservationForm, SignUpForm, ScoreForm, EditProfileForm, SearchRoomForm, AcceptScoreForm
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import etag
+
+from . import analytics, bulk_scores, ical, inbox, leaderboard, page_cache, utilization
+from .avatars import get_thumbnail, InvalidAvatar
+from .availability import book_court, week_grid, CourtUnavailable
+from .matchmaking import suggested_reservations
+from .page_cache import AnonymousPageCacheMixin, SPORT_CENTRES, sport_center_scope
+from .pagination import KeysetPaginator
+from .ratings import chart_points
+from .models import SportCenter, Reservation, MyUser, UserStats, Score, Messages, Notification, RatingHistory, SKILLS
+from .notifications import notify, notify_many
+from .forms import CreateReservationForm, SignUpForm, ScoreForm, EditProfileForm, SearchRoomForm, AcceptScoreForm,\
+    BulkScoreEntryForm, BulkScoreUploadForm, BulkConfirmForm, UtilizationForm
 
 # Create your views here.
 from django.views import View
 from django.views.generic import FormView, DetailView
 
 
+RATING_CHART_LENGTH = 100
+
+
 class HomeView(View):
     def get(self, request):
         return render(request, 'index.html', {})
@@ -42,12 +60,26 @@ class SignUpView(View):
 
 class ShowProfileView(View):
     def get(self, request, user_id):
-        user = MyUser.objects.get(pk=user_id)
+        user = MyUser.objects.select_related('stats').get(pk=user_id)
         games = user.reservation.all()
-        user_stat = UserStats.objects.get_or_create(user_id=user_id)
+        try:
+            user_stat = user.stats
+        except UserStats.DoesNotExist:
+            user_stat = UserStats(user=user)
+        history = RatingHistory.objects.filter(user=user).order_by('-date', '-id')\
+            .values_list('rating', flat=True)[:RATING_CHART_LENGTH]
         return render(request, 'show_profile.html', {"user": user,
                                                      "games": games,
-                                                     "user_stat": user_stat})
+                                                     "user_stat": user_stat,
+                                                     "rating_chart": chart_points(list(history)[::-1])})
+
+
+class ProfileStatsView(View):
+    def get(self, request, user_id):
+        # Not "user", which is the logged in player the navigation bar shows.
+        profile_user = get_object_or_404(MyUser, pk=user_id)
+        return render(request, 'profile_stats.html', {"profile_user": profile_user,
+                                                      "analytics": analytics.player_analytics(profile_user.pk)})
 
 
 class CreateReservationView(LoginRequiredMixin, View):
@@ -63,44 +95,62 @@ class CreateReservationView(LoginRequiredMixin, View):
             time_start = form.cleaned_data['time_start'] + ':00'
             time_end = form.cleaned_data['time_end'] + ':00'
             parsed_time = datetime.datetime.strptime(time_start, '%H:%M').time()
+            parsed_time_end = datetime.datetime.strptime(time_end, '%H:%M').time()
             date_to_check = datetime.datetime.combine(date, parsed_time)
             now = datetime.datetime.now()
             if date_to_check < now:
                 message = 'Wybierz datę z przyszłości.'
                 return render(request, 'create_reservation.html', {'message': message,
                                                                    'form': form,})
-            Reservation.objects.create(user_main=request.user,
-                                       location=location,
-                                       date=date,
-                                       time_start=time_start,
-                                       time_end=time_end)
+            if parsed_time_end <= parsed_time:
+                message = 'Koniec rezerwacji musi być później niż jej początek.'
+                return render(request, 'create_reservation.html', {'message': message,
+                                                                   'form': form,})
+            try:
+                book_court(request.user, location, date, parsed_time, parsed_time_end)
+            except CourtUnavailable as error:
+                return render(request, 'create_reservation.html', {'message': str(error),
+                                                                   'form': form,})
             return redirect(reverse('user_reservations'))
 
 
-class SportCenterListView(View):
+class SportCenterListView(AnonymousPageCacheMixin, View):
+    cache_name = 'sport_centres'
+
     def get(self, request):
-        sport_centres = SportCenter.objects.all()
-        return render(request, 'sport_centres_list.html', {'sport_centres': sport_centres})
+        paginator = KeysetPaginator(SportCenter.objects.all(), ('name', 'id'))
+        # Only evaluated when the cached fragment is missing.
+        page = SimpleLazyObject(lambda: paginator.page_from_request(request))
+        return render(request, 'sport_centres_list.html', {'page': page,
+                                                           'cache_scopes': self.get_cache_scopes()})
+
 
+class SportCenterDetailView(AnonymousPageCacheMixin, DetailView):
+    queryset = SportCenter.objects.with_capacity()
+    cache_name = 'sport_center_detail'
 
-class SportCenterDetailView(DetailView):
-    queryset = SportCenter.objects.all()
+    def get_cache_scopes(self):
+        return [SPORT_CENTRES, sport_center_scope(self.kwargs['slug'])]
 
     def get_context_data(self, **kwargs):
-        print(self.kwargs)
         context = super(SportCenterDetailView, self).get_context_data(**kwargs)
-        print(context)
+        context['week'] = partial(week_grid, self.object)
+        context['today'] = datetime.date.today()
+        context['cache_scopes'] = self.get_cache_scopes()
         return context
 
 
 class JoinRoomView(LoginRequiredMixin, View):
     def get(self, request):
         form = SearchRoomForm()
-        rooms = Reservation.objects.filter(user_partner__isnull=True,
-                                           date__gte=datetime.datetime.today(),
-                                           user_main__skill=request.user.skill).exclude(user_main=request.user).order_by('date')
-
-        return render(request, 'reservations_list.html', {'rooms': rooms,
+        rooms = Reservation.objects.joinable_by(request.user).for_listing()
+        page = KeysetPaginator(rooms, ('date', 'id')).page_from_request(request)
+        first_page = not (request.GET.get('after') or request.GET.get('before'))
+
+        return render(request, 'reservations_list.html', {'rooms': page.object_list,
+                                                          'page': page,
+                                                          'suggestions': suggested_reservations(request.user, 5)
+                                                          if first_page else [],
                                                           'form': form})
 
     def post(self, request):
@@ -110,13 +160,9 @@ class JoinRoomView(LoginRequiredMixin, View):
             date_end = form.cleaned_data['date_end']
             location = form.cleaned_data['location']
             opponent_skill = form.cleaned_data['opponent_skill']
-            queryset = Reservation.objects.filter(date__gte=date_start,
-                                                  date__lte=date_end,
-                                                  location=location,
-                                                  user_main__skill=opponent_skill).exclude(Q(user_main=request.user) |
-                                                                                           Q(user_partner=request.user))
-            return render(request, 'room_list.html', {'queryset': queryset,
-                                                      'form': form})
+            queryset = Reservation.objects.search(request.user, date_start, date_end, location, opponent_skill)
+            return render(request, 'reservations_list.html', {'queryset': queryset.for_listing(),
+                                                              'form': form})
 
 
 class ReservationDetailView(View):
@@ -153,13 +199,19 @@ class ReservationDetailView(View):
                 if not past:
                     cancel_reservation = True
 
-        print(reservation.user_main_id)
-        print(self.request.user.id)
+        # accept score button
+        accept_score = False
+        if score and not score.is_confirmed:
+            if request.user.id == reservation.user_main_id:
+                accept_score = not score.is_confirmed_by_user_main
+            elif request.user.id == reservation.user_partner_id:
+                accept_score = not score.is_confirmed_by_user_partner
 
         context = {'room'               : reservation,
                    'score_form'         : score_form,
                    'score'              : score,
-                   'cancel_reservation' : cancel_reservation
+                   'cancel_reservation' : cancel_reservation,
+                   'accept_score'       : accept_score,
                    }
 
         return render(request, 'reservation_detail.html', context)
@@ -167,63 +219,186 @@ class ReservationDetailView(View):
     def post(self, request, room_id):
         room = Reservation.objects.get(pk=room_id)
         if room.user_partner_id is None:
-            room.user_partner_id = request.user.id
-            room.save()
-            message = "Pomyślnie dołączyłeś do rezerwacji %s" % room.user_main
-            private_message = "%s dołączył do Twojej rezerwacji" % room.user_partner
-            Messages.objects.create(user=room.user_main, content=private_message)
+            # A player who lost the race lands on the room page showing who joined first.
+            room.join(request.user)
             return redirect('/reservations_list/%s' % room_id)
         else:
             form = ScoreForm(request.POST, prefix='score')
-            if 'score-user_main_score' and 'score-user_partner_score' in request.POST:
+            if 'score-user_main_score' in request.POST and 'score-user_partner_score' in request.POST:
                 if form.is_valid():
                     score = form.save(commit=False)
                     score.room = room
                     score.save()
+                    score.confirm(request.user)
+                    opponent = room.user_partner if request.user.id == room.user_main_id else room.user_main
+                    notify(Notification.SCORE_SUBMITTED, opponent,
+                           "%s wpisał wynik meczu %s: %s. Potwierdź go." % (request.user, room.date, score))
                 return redirect('/reservations_list/%s' % room_id)
             elif 'accept_score' in request.POST:
-                room.score.is_confirmed_by_user_partner = True
-                    # user_main_stats, _ = UserStats.objects.get_or_create(user_id=room.user_main_id)
-                    # user_partner_stats, _ = UserStats.objects.get_or_create(user_id=room.user_partner_id)
-
-
-                        # if score.user_main_score > score.user_partner_score:
-                        #     UserStats.objects.add_winner_stats(user_main_stats, score)
-                        #     UserStats.objects.add_looser_stats(user_partner_stats, score)
-                        # else:
-                        #     UserStats.objects.add_winner_stats(user_partner_stats, score)
-                        #     UserStats.objects.add_looser_stats(user_main_stats, score)
-
-
+                room.score.confirm(request.user)
                 return redirect('/reservations_list/%s' % room_id)
 
 
 class DeleteRoom(View):
     def get(self, request, room_id):
         room = Reservation.objects.get(pk=room_id)
+        players = [player for player in (room.user_main, room.user_partner) if player and player != request.user]
+        content = "Rezerwacja %s %s w %s została odwołana" % (room.date, room.time_start, room.location)
+        notify_many([Notification(user=player, event=Notification.RESERVATION_CANCELLED, content=content)
+                     for player in players])
         room.delete()
         return redirect('/profile/%s' % request.user.id)
 
 
 class UserReservationsView(View):
     def get(self, request):
-        rooms = request.user.reservation.filter(date__gt=datetime.datetime.now()).order_by('date')
+        rooms = Reservation.objects.hosted_by(request.user).for_listing()
         return render(request, 'user_reservations.html', {'rooms': rooms})
 
 
 class UserHistoryView(View):
     def get(self, request):
-        rooms = Reservation.objects.filter(Q(user_main=request.user) | Q(user_partner=request.user),
-                                           date__lt=datetime.datetime.today()).order_by('date')
-        return render(request, 'user_history.html', {'rooms': rooms})
+        rooms = Reservation.objects.history_of(request.user).for_listing()
+        page = KeysetPaginator(rooms, ('date', 'id')).page_from_request(request)
+        return render(request, 'user_history.html', {'rooms': page.object_list,
+                                                     'page': page})
 
 
 class UserFutureGamesView(View):
     def get(self, request):
-        games = Reservation.objects.filter(Q(user_main=request.user) | Q(user_partner=request.user),
-                                           Q(user_main__isnull=False), Q(user_partner__isnull=False),
-                                           date__gt=datetime.datetime.today())
-        return render(request, 'user_games.html', {'games': games})
+        games = Reservation.objects.upcoming_games_of(request.user).for_listing()
+        calendar_url = request.build_absolute_uri(reverse('calendar_feed', args=[ical.feed_token(request.user)]))
+        return render(request, 'user_games.html', {'games': games,
+                                                   'calendar_url': calendar_url})
+
+
+def calendar_etag(request, token):
+    user_id = ical.user_id_from_token(token)
+    return ical.feed_etag(user_id) if user_id is not None else None
+
+
+class CalendarFeedView(View):
+    @method_decorator(etag(calendar_etag))
+    def get(self, request, token):
+        user_id = ical.user_id_from_token(token)
+        if user_id is None:
+            raise Http404
+        user = get_object_or_404(MyUser, pk=user_id)
+        response = StreamingHttpResponse(ical.feed(user), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="squash.ics"'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class LeaderboardView(View):
+    def get(self, request, skill=None):
+        if skill is None:
+            skill = getattr(request.user, 'skill', None) or SKILLS[0][0]
+        try:
+            number = int(request.GET.get('page', 1))
+        except ValueError:
+            number = 1
+        page = leaderboard.get_page(int(skill), number)
+        return render(request, 'leaderboard.html', {'page': page,
+                                                    'skills': SKILLS})
+
+
+class CacheStatsView(View):
+    def get(self, request):
+        context = admin.site.each_context(request)
+        context.update({'title': 'Statystyki cache', 'rows': page_cache.stats(), 'release': page_cache.release()})
+        return render(request, 'admin/cache_stats.html', context)
+
+    def post(self, request):
+        page_cache.reset_stats()
+        return redirect('cache_stats')
+
+
+class BulkScoresView(View):
+    """Lets league organizers enter or upload the scores of many matches and confirm pending ones at once."""
+
+    def get(self, request):
+        return self.render(request)
+
+    def post(self, request):
+        action = request.POST.get('action')
+        if action == 'confirm':
+            form = BulkConfirmForm(request.POST)
+            if form.is_valid():
+                scores = bulk_scores.confirm(form.cleaned_data['scores'].values_list('pk', flat=True))
+                messages.success(request, 'Potwierdzono wyniki: %s.' % len(scores))
+                return redirect('bulk_scores')
+            return self.render(request, confirm_form=form)
+
+        if action == 'upload':
+            form = BulkScoreUploadForm(request.POST, request.FILES)
+            bound = {'upload_form': form}
+        else:
+            form = BulkScoreEntryForm(request.POST, rooms=bulk_scores.unscored_rooms())
+            bound = {'entry_form': form}
+        if form.is_valid():
+            try:
+                rows = form.cleaned_data.get('rows') or bulk_scores.parse_csv(form.cleaned_data['csv_file'])
+                scores = bulk_scores.create(rows, confirmed=form.cleaned_data['confirmed'])
+            except bulk_scores.BulkScoreError as error:
+                for message in error.errors:
+                    form.add_error(None, message)
+            else:
+                messages.success(request, 'Zapisano wyniki: %s.' % len(scores))
+                return redirect('bulk_scores')
+        return self.render(request, **bound)
+
+    def render(self, request, entry_form=None, upload_form=None, confirm_form=None):
+        context = admin.site.each_context(request)
+        context.update({'title': 'Wyniki ligowe',
+                        'entry_form': entry_form or BulkScoreEntryForm(rooms=bulk_scores.unscored_rooms()),
+                        'upload_form': upload_form or BulkScoreUploadForm(),
+                        'confirm_form': confirm_form or BulkConfirmForm(),
+                        'pending': bulk_scores.pending_scores()})
+        return render(request, 'admin/bulk_scores.html', context)
+
+
+class UtilizationView(View):
+    """Weekday by hour heatmap of booked against available courts of every sport centre."""
+
+    def get(self, request):
+        form = UtilizationForm(request.GET)
+        report = None
+        if form.is_valid():
+            report = utilization.report(form.cleaned_data['date_start'], form.cleaned_data['date_end'])
+        return self.respond(request, form, report)
+
+    def respond(self, request, form, report):
+        context = admin.site.each_context(request)
+        context.update({'title': 'Wykorzystanie kortów',
+                        'form': form,
+                        'report': report,
+                        'grids': utilization.heatmap(report) if report else [],
+                        'hours': utilization.HOURS.tolist(),
+                        'query': request.GET.urlencode()})
+        return render(request, 'admin/utilization.html', context)
+
+
+class UtilizationCsvView(UtilizationView):
+    def respond(self, request, form, report):
+        if report is None:
+            return super(UtilizationCsvView, self).respond(request, form, report)
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="utilization-%s-%s.csv"' % (report.date_start,
+                                                                                             report.date_end)
+        utilization.write_csv(report, response)
+        return response
+
+
+class AvatarThumbnailView(View):
+    def get(self, request, size, name):
+        try:
+            path = get_thumbnail(name, int(size))
+        except (IOError, InvalidAvatar, SuspiciousFileOperation):
+            raise Http404
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+        response['Cache-Control'] = 'public, max-age=604800'
+        return response
 
 
 class EditProfileView(View):
@@ -232,13 +407,21 @@ class EditProfileView(View):
         return render(request, 'edit_profile.html', {'form': form})
 
     def post(self, request):
+        old_skill = request.user.skill
         form = EditProfileForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
             form.save()
-            return render(request, 'show_profile.html', {'form': form})
+            if 'skill' in form.changed_data:
+                leaderboard.invalidate(old_skill, form.instance.skill)
+            return redirect(reverse('profile', args=[request.user.id]))
+        return render(request, 'edit_profile.html', {'form': form})
 
 
 class MessagesView(View):
     def get(self, request):
         messages = Messages.objects.filter(user=request.user)
-        return render(request, 'kalendar.html', {'messages': messages})
\ No newline at end of file
+        page = KeysetPaginator(messages, ('-date', '-id')).page_from_request(request)
+        # Only the messages shown are read, the older pages stay unread until opened.
+        inbox.mark_read(request.user, [message.pk for message in page.object_list])
+        return render(request, 'messages.html', {'messages': page.object_list,
+                                                 'page': page})
\ No newline at end of file
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+# Matches the 12 character MD5 prefix ManifestStaticFilesStorage puts into file names.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+# Avatars are stored under the SHA-256 of their content, see avatars.process_upload.
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{64}\.[^/]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=3600'
+CHUNK_SIZE = 64 * 1024
+
+
+class StaticFilesMiddleware(object):
+    """WSGI middleware serving STATIC_URL and MEDIA_URL straight from disk, in front of Django.
+
+    Hashed and content-addressed files get an immutable Cache-Control, everything gets an ETag,
+    precompressed ``.br``/``.gz`` variants are picked from Accept-Encoding and single byte ranges are supported.
+    Each variant has its own ETag, and a request for several ranges gets the whole file.
+    """
+
+    def __init__(self, application, mounts):
+        self.application = application
+        # (url prefix, directory, immutable name pattern or None)
+        self.mounts = [(prefix, os.path.abspath(root), pattern) for prefix, root, pattern in mounts]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        for prefix, root, pattern in self.mounts:
+            if path.startswith(prefix):
+                if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+                    break
+                return self.serve(environ, start_response, root, path[len(prefix):], pattern)
+        return self.application(environ, start_response)
+
+    def resolve(self, root, name):
+        path = os.path.abspath(os.path.join(root, name))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def serve(self, environ, start_response, root, name, pattern):
+        path = self.resolve(root, name)
+        if path is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+
+        # Anything but a single byte range, multiple ranges included, is answered with the whole file.
+        match = RANGE.match(environ.get('HTTP_RANGE', '').strip())
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding = None
+        if not match:
+            accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+            for candidate, extension in ENCODINGS:
+                if candidate in accepted and os.path.isfile(path + extension):
+                    encoding, path = candidate, path + extension
+                    break
+
+        stat = os.stat(path)
+        # Every encoding is a different representation and gets its own strong ETag.
+        etag = '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, '-' + encoding if encoding else '')
+        headers = [('Content-Type', content_type),
+                   ('ETag', etag),
+                   ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+                   ('Cache-Control', IMMUTABLE if pattern and pattern.search(name) else SHORT_LIVED),
+                   ('Accept-Ranges', 'bytes'),
+                   ('Vary', 'Accept-Encoding')]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+
+        if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified', headers)
+            return []
+
+        if match:
+            return self.serve_range(environ, start_response, path, stat.st_size, match, headers)
+
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', headers)
+        return self.body(environ, path, 0, stat.st_size)
+
+    def serve_range(self, environ, start_response, path, size, match, headers):
+        start, end = match.groups()
+        if start:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        elif end:
+            start, end = max(size - int(end), 0), size - 1
+        if start == '' or start > end:
+            start_response('416 Range Not Satisfiable', headers + [('Content-Range', 'bytes */%s' % size)])
+            return []
+        headers += [('Content-Range', 'bytes %s-%s/%s' % (start, end, size)),
+                    ('Content-Length', str(end - start + 1))]
+        start_response('206 Partial Content', headers)
+        return self.body(environ, path, start, end - start + 1)
+
+    def body(self, environ, path, offset, length):
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        source = open(path, 'rb')
+        if offset == 0 and length == os.fstat(source.fileno()).st_size and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](source, CHUNK_SIZE)
+        source.seek(offset)
+        return self.read(source, length)
+
+    def read(self, source, remaining):
+        with source:
+            while remaining > 0:
+                chunk = source.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk